@@ -0,0 +1,181 @@
+import asyncio
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Page, Paginator
+from django.db import close_old_connections
+from django.db.models import BooleanField, Value
+from django.http import HttpResponse
+from django.urls import path
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from recipes.models import Follow, Recipe
+
+from .fast_serializers import FastRecipeSerializer
+from .pagination import CustomPagination, KeysetPagination
+from .relations import get_relations
+from .renderers import FastJSONRenderer
+from .serializers import (FollowSerializer, get_recipe_nutrition,
+                          get_recipes_limit, get_similar_recipes)
+
+
+def call_in_thread(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run(func, *args, **kwargs):
+    """Выполняет синхронный код в пуле потоков, не блокируя цикл событий.
+
+    thread_sensitive=False: вызовы одного запроса идут параллельно,
+    у каждого потока своё соединение с БД.
+    """
+    return sync_to_async(call_in_thread, thread_sensitive=False)(
+        func, *args, **kwargs)
+
+
+def offload(view):
+    """Синхронное представление DRF, вызываемое из пула потоков.
+
+    Под ASGI Django 3.2 выполняет синхронные представления в одном общем
+    потоке, поэтому медленный запрос задерживает остальные.
+    """
+    async def async_view(request, *args, **kwargs):
+        return await run(view, request, *args, **kwargs)
+
+    async_view.csrf_exempt = True
+    return async_view
+
+
+def accepts_json(request):
+    return (request.GET.get(api_settings.URL_FORMAT_OVERRIDE, 'json')
+            == 'json'
+            and 'text/html' not in request.META.get('HTTP_ACCEPT', ''))
+
+
+def authenticate(request):
+    """DRF Request с аутентифицированным пользователем или None."""
+    request = Request(request, authenticators=[
+        authenticator()
+        for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        is_authenticated = request.user.is_authenticated
+    except APIException:
+        return None
+    return request if is_authenticated else None
+
+
+def json_response(data):
+    response = HttpResponse(
+        FastJSONRenderer().render(data), content_type='application/json')
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def make_view(handler, fallback):
+    """Асинхронный GET для аутентифицированных JSON-запросов.
+
+    Всё остальное - анонимные запросы с их кэшем, запись, ошибки
+    аутентификации, другие форматы - и случаи, когда ``handler`` вернул
+    None, обрабатывает синхронное представление ``fallback``.
+    """
+    fallback = offload(fallback)
+
+    async def async_view(request, *args, **kwargs):
+        if (request.method != 'GET'
+                or 'HTTP_AUTHORIZATION' not in request.META
+                or not accepts_json(request)):
+            return await fallback(request, *args, **kwargs)
+        drf_request = await run(authenticate, request)
+        if drf_request is None:
+            return await fallback(request, *args, **kwargs)
+        response = await handler(drf_request, *args, **kwargs)
+        if response is None:
+            return await fallback(request, *args, **kwargs)
+        return response
+
+    async_view.csrf_exempt = True
+    return async_view
+
+
+async def recipe_detail(request, pk):
+    """Рецепт, его тэги, ингредиенты и связи зрителя читаются параллельно."""
+    serializer = FastRecipeSerializer(context={'request': request})
+    (rows, tags, ingredients, relations, similar,
+     nutrition) = await asyncio.gather(
+        run(serializer.load_rows, Recipe.objects.filter(pk=pk)),
+        run(serializer.load_tags, (pk,)),
+        run(serializer.load_ingredients, (pk,)),
+        run(get_relations, request),
+        run(get_similar_recipes, pk, request),
+        run(get_recipe_nutrition, pk),
+    )
+    if not rows:
+        return None
+    data = serializer.build(rows, tags, ingredients, relations)[0]
+    data['similar_recipes'] = similar
+    data['nutrition'] = nutrition
+    return json_response(data)
+
+
+async def subscriptions(request):
+    """Подсчёт подписок и страница с превью рецептов читаются параллельно."""
+    pagination = CustomPagination()
+    params = request.query_params
+    if (KeysetPagination.cursor_query_param in params
+            or pagination.pagination_query_param in params
+            or pagination.approximate_count_query_param in params):
+        return None
+    try:
+        number = int(params.get(pagination.page_query_param, 1))
+    except ValueError:
+        return None
+    page_size = pagination.get_page_size(request)
+    if number < 1 or not page_size:
+        return None
+    queryset = Follow.objects.filter(user=request.user).order_by('-created')
+    bottom = (number - 1) * page_size
+    count, follows = await asyncio.gather(
+        run(queryset.count),
+        run(list, queryset.with_recipes(
+            get_recipes_limit(request)
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        )[bottom:bottom + page_size]),
+    )
+    paginator = Paginator(queryset, page_size)
+    paginator.count = count
+    if number > paginator.num_pages:
+        return None
+    pagination.page = Page(follows, number, paginator)
+    pagination.request = request
+
+    def serialize():
+        return FollowSerializer(
+            follows, many=True, context={'request': request}).data
+
+    data = await run(serialize)
+    return json_response(OrderedDict([
+        ('count', count),
+        ('next', pagination.get_next_link()),
+        ('previous', pagination.get_previous_link()),
+        ('results', data),
+    ]))
+
+
+def get_urlpatterns(router):
+    """Асинхронные маршруты поверх синхронных представлений роутера."""
+    views = {pattern.name: pattern.callback for pattern in router.urls}
+    return [
+        path('recipes/<int:pk>/',
+             make_view(recipe_detail, views['recipes-detail'])),
+        path('users/subscriptions/',
+             make_view(subscriptions, views['users-subscriptions'])),
+        path('ingredients/', offload(views['ingredients-list'])),
+    ]
@@ -0,0 +1,44 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+VERSION_KEY = 'api:version:{}'
+RESPONSE_KEY = 'api:response:{}:{}:{}'
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def get_version(namespace):
+    """Текущая версия данных пространства имён.
+
+    Версия - время последнего изменения в микросекундах, поэтому из неё же
+    получается заголовок Last-Modified.
+    """
+    cache = get_cache()
+    version = cache.get(VERSION_KEY.format(namespace))
+    if version is None:
+        version = int(time.time() * 1000000)
+        if not cache.add(VERSION_KEY.format(namespace), version, None):
+            version = cache.get(VERSION_KEY.format(namespace), version)
+    return version
+
+
+def bump_version(*namespaces):
+    version = int(time.time() * 1000000)
+    get_cache().set_many(
+        {VERSION_KEY.format(namespace): version for namespace in namespaces},
+        None
+    )
+
+
+def get_response_key(namespace, version, path):
+    digest = hashlib.md5(path.encode()).hexdigest()
+    return RESPONSE_KEY.format(namespace, version, digest)
+
+
+def make_etag(body):
+    return '"{}"'.format(hashlib.md5(body).hexdigest())
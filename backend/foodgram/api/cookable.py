@@ -0,0 +1,208 @@
+import threading
+from collections import namedtuple
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+
+from recipes.models import IngredientsAmount
+
+from .cache import get_cache
+
+SEQUENCE_KEY = 'api:cookable:sequence'
+CHANGE_KEY = 'api:cookable:change:{}'
+# Запись журнала вместо id рецепта: индекс нужно построить заново.
+RESET = 'reset'
+
+
+def record_changes(recipe_ids):
+    """Записывает изменённые рецепты в журнал для индексов всех процессов."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    cache = get_cache()
+    cache.add(SEQUENCE_KEY, 0, None)
+    last = cache.incr(SEQUENCE_KEY, len(recipe_ids))
+    first = last - len(recipe_ids) + 1
+    cache.set_many({
+        CHANGE_KEY.format(number): recipe_id
+        for number, recipe_id in enumerate(recipe_ids, first)
+    }, settings.COOKABLE_CHANGES_TIMEOUT)
+
+
+def reset_cookable_index():
+    record_changes((RESET,))
+
+
+IndexData = namedtuple(
+    'IndexData', ('positions', 'recipe_ids', 'sizes', 'postings'))
+EMPTY_INDEX = IndexData({}, np.zeros(0, np.int64), np.zeros(0, np.int32), {})
+
+
+def load_amounts(queryset):
+    """Строки (рецепт, ингредиент, количество) массивом numpy."""
+    rows = queryset.order_by().values_list(
+        'recipe_id', 'ingredient_id', 'amount')
+    return np.fromiter(
+        chain.from_iterable(rows), dtype=np.int64).reshape(-1, 3)
+
+
+def make_postings(ingredient_ids, amounts, positions):
+    """Списки рецептов по ингредиентам, упорядоченные по количеству."""
+    order = np.lexsort((positions, amounts, ingredient_ids))
+    ingredient_ids = ingredient_ids[order]
+    amounts = amounts[order].astype(np.int32)
+    positions = positions[order].astype(np.int32)
+    bounds = np.flatnonzero(np.diff(ingredient_ids)) + 1
+    return {
+        int(ingredient_ids[start]): (amounts[start:end], positions[start:end])
+        for start, end in zip(
+            chain((0,), bounds), chain(bounds, (len(ingredient_ids),)))
+        if start < end
+    }
+
+
+def get_missing(ingredients, pantry):
+    """id ингредиентов из представления рецепта, которых нет или мало."""
+    return [
+        ingredient['id'] for ingredient in ingredients
+        if ingredient['id'] not in pantry or (
+            pantry[ingredient['id']] is not None
+            and pantry[ingredient['id']] < ingredient['amount'])
+    ]
+
+
+class CookableIndex:
+    """Индекс «что приготовить из того, что есть» в памяти процесса.
+
+    Рецепты пронумерованы подряд, для каждого хранится число
+    ингредиентов; для каждого ингредиента - массив номеров рецептов,
+    упорядоченный по нужному количеству, так что рецепты, которым
+    хватает имеющегося, - префикс массива. Покрытие всех рецептов
+    считается одним np.bincount по префиксам ингредиентов запроса.
+    Изменения рецептов применяются по журналу в кэше, целиком индекс
+    строится при первом запросе и после сброса. Данные заменяются
+    копией, поэтому запросы читают их без блокировки.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sequence = None
+        self._data = EMPTY_INDEX
+
+    def _sync(self):
+        cache = get_cache()
+        sequence = cache.get(SEQUENCE_KEY, 0)
+        if sequence == self._sequence:
+            return
+        with self._lock:
+            if sequence == self._sequence:
+                return
+            changes = None
+            if self._sequence is not None and sequence > self._sequence:
+                keys = [
+                    CHANGE_KEY.format(number)
+                    for number in range(self._sequence + 1, sequence + 1)
+                ]
+                if len(keys) <= settings.COOKABLE_MAX_CHANGES:
+                    changes = cache.get_many(keys)
+                    if (len(changes) < len(keys)
+                            or RESET in changes.values()):
+                        changes = None
+            if changes is None:
+                self._data = self._build()
+            else:
+                self._data = self._update(set(changes.values()))
+            self._sequence = sequence
+
+    def _build(self):
+        rows = load_amounts(IngredientsAmount.objects.all())
+        recipe_ids, positions, sizes = np.unique(
+            rows[:, 0], return_inverse=True, return_counts=True)
+        return IndexData(
+            positions={
+                recipe_id: position
+                for position, recipe_id in enumerate(recipe_ids.tolist())
+            },
+            recipe_ids=recipe_ids,
+            sizes=sizes.astype(np.int32),
+            postings=make_postings(rows[:, 1], rows[:, 2], positions),
+        )
+
+    def _update(self, recipe_ids):
+        data = self._data
+        positions = dict(data.positions)
+        changed = np.zeros(len(data.sizes), dtype=bool)
+        changed[[
+            positions[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in positions
+        ]] = True
+        postings = {}
+        for ingredient_id, (amounts, recipe_positions) in (
+                data.postings.items()):
+            keep = ~changed[recipe_positions]
+            if not keep.all():
+                amounts = amounts[keep]
+                recipe_positions = recipe_positions[keep]
+            postings[ingredient_id] = (amounts, recipe_positions)
+        sizes = data.sizes.copy()
+        sizes[changed] = 0
+
+        rows = load_amounts(
+            IngredientsAmount.objects.filter(recipe_id__in=recipe_ids))
+        new_ids = sorted(set(rows[:, 0].tolist()) - positions.keys())
+        for recipe_id in new_ids:
+            positions[recipe_id] = len(positions)
+        all_ids = np.concatenate(
+            (data.recipe_ids, np.array(new_ids, dtype=np.int64)))
+        sizes = np.concatenate((sizes, np.zeros(len(new_ids), np.int32)))
+        row_positions = np.array(
+            [positions[recipe_id] for recipe_id in rows[:, 0].tolist()],
+            dtype=np.int64)
+        np.add.at(sizes, row_positions, 1)
+        for ingredient_id, (amounts, recipe_positions) in make_postings(
+                rows[:, 1], rows[:, 2], row_positions).items():
+            current = postings.get(ingredient_id)
+            if current is not None:
+                amounts = np.concatenate((current[0], amounts))
+                recipe_positions = np.concatenate(
+                    (current[1], recipe_positions))
+                order = np.lexsort((recipe_positions, amounts))
+                amounts = amounts[order]
+                recipe_positions = recipe_positions[order]
+            postings[ingredient_id] = (amounts, recipe_positions)
+        return IndexData(positions, all_ids, sizes, postings)
+
+    def search(self, pantry, max_missing):
+        """Рецепты, которым не хватает не больше ``max_missing`` ингредиентов.
+
+        ``pantry`` - {id ингредиента: количество или None}. Возвращает
+        список ``(recipe_id, missing)``: сначала те, что можно
+        приготовить целиком, затем с одним недостающим и так далее; при
+        равенстве - с большим числом совпадений и более новые.
+        """
+        self._sync()
+        data = self._data
+        parts = []
+        for ingredient_id, available in pantry.items():
+            postings = data.postings.get(ingredient_id)
+            if postings is None:
+                continue
+            amounts, recipe_positions = postings
+            if available is not None:
+                recipe_positions = recipe_positions[:np.searchsorted(
+                    amounts, available, side='right')]
+            parts.append(recipe_positions)
+        if not parts:
+            return []
+        covered = np.bincount(
+            np.concatenate(parts), minlength=len(data.sizes))
+        missing = data.sizes - covered
+        found = np.flatnonzero((covered > 0) & (missing <= max_missing))
+        recipe_ids = data.recipe_ids[found]
+        order = np.lexsort((-recipe_ids, -covered[found], missing[found]))
+        return list(zip(
+            recipe_ids[order].tolist(), missing[found][order].tolist()))
+
+
+cookable_index = CookableIndex()
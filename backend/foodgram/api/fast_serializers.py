@@ -0,0 +1,205 @@
+from collections import defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+
+from recipes.models import IngredientsAmount, Recipe, Tag
+
+from .relations import get_relations
+from .serializers import (AllUserSerializer, IngredientSerializer,
+                          IngredientsAmountSerializer, RecipeGetSerializer,
+                          TagSerializer, get_image_variant_urls)
+
+# Поля, чьё представление совпадает со значением из values().
+PLAIN_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.ReadOnlyField,
+)
+
+
+class FieldPlan:
+    """Порядок и источники полей, скомпилированные из сериализатора DRF.
+
+    Обычные поля читаются из строк values() по своему source, вычисляемые
+    и вложенные задаются в ``producers`` функциями ``(row, context)``.
+    Поле сериализатора, которое план не умеет получить, - ошибка
+    компиляции, а не расхождение в ответе.
+    """
+
+    def __init__(self, serializer_class, producers=None, prefix='',
+                 lookups=()):
+        producers = producers or {}
+        self.lookups = list(lookups)
+        self.fields = []
+        for name, field in serializer_class().fields.items():
+            if name in producers:
+                self.fields.append((name, None, producers[name]))
+                continue
+            if (isinstance(field, (serializers.BaseSerializer,
+                                   serializers.SerializerMethodField))
+                    or field.source == '*'):
+                raise ImproperlyConfigured(
+                    f'{serializer_class.__name__}.{name}: '
+                    'для поля нужен producer.')
+            lookup = prefix + field.source.replace('.', '__')
+            convert = (
+                None if isinstance(field, PLAIN_FIELDS)
+                else field.to_representation
+            )
+            self.lookups.append(lookup)
+            self.fields.append((name, lookup, convert))
+        self.lookups = list(dict.fromkeys(self.lookups))
+
+    def build(self, row, context=None):
+        data = {}
+        for name, lookup, convert in self.fields:
+            if lookup is None:
+                data[name] = convert(row, context)
+                continue
+            value = row[lookup]
+            if value is not None and convert is not None:
+                value = convert(value)
+            data[name] = value
+        return data
+
+
+class FastListSerializer:
+    """Сериализация списка строк values() по плану полей.
+
+    Результат совпадает с ``serializer_class(many=True).data``, но без
+    создания полей и OrderedDict на каждый объект.
+    """
+
+    serializer_class = None
+    _plans = {}
+
+    def __init__(self, context=None):
+        self.context = context or {}
+
+    @classmethod
+    def get_plan(cls):
+        plan = cls._plans.get(cls)
+        if plan is None:
+            plan = cls._plans[cls] = cls.compile_plan()
+        return plan
+
+    @classmethod
+    def compile_plan(cls):
+        return FieldPlan(cls.serializer_class)
+
+    @property
+    def lookups(self):
+        return self.get_plan().lookups
+
+    def to_representation(self, rows):
+        build = self.get_plan().build
+        return [build(row, self.context) for row in rows]
+
+
+class FastIngredientSerializer(FastListSerializer):
+    serializer_class = IngredientSerializer
+
+
+def get_image_url(name, request):
+    if not name:
+        return None
+    url = Recipe._meta.get_field('image').storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+class FastRecipeSerializer(FastListSerializer):
+    """Список рецептов в формате RecipeGetSerializer.
+
+    Автор читается тем же запросом через JOIN, тэги и ингредиенты
+    страницы - двумя запросами values(), флаги пользователя берутся из
+    множеств связей.
+    """
+
+    serializer_class = RecipeGetSerializer
+
+    @classmethod
+    def compile_plan(cls):
+        author = FieldPlan(AllUserSerializer, prefix='author__', producers={
+            'is_subscribed': lambda row, context: (
+                row['author_id'] in context['relations'].following),
+        })
+        tag = FieldPlan(TagSerializer, prefix='tag__')
+        ingredient = FieldPlan(IngredientsAmountSerializer)
+        recipe = FieldPlan(
+            cls.serializer_class,
+            producers={
+                'tags': lambda row, context: context['tags'].get(
+                    row['id'], []),
+                'author': author.build,
+                'ingredients': lambda row, context: (
+                    context['ingredients'].get(row['id'], [])),
+                'is_favorited': lambda row, context: (
+                    row['id'] in context['relations'].favorites),
+                'is_in_shopping_cart': lambda row, context: (
+                    row['id'] in context['relations'].shopping_cart),
+                'image': lambda row, context: get_image_url(
+                    row['image'], context['request']),
+                'image_variants': lambda row, context: get_image_variant_urls(
+                    row['image'], row['image_variant_files'],
+                    context['request']),
+            },
+            lookups=('id', 'author_id', 'image', 'image_variant_files',
+                     *author.lookups),
+        )
+        recipe.tag = tag
+        recipe.ingredient = ingredient
+        return recipe
+
+    def load_rows(self, queryset):
+        return list(queryset.values(*self.lookups))
+
+    def load_tags(self, ids):
+        plan = self.get_plan().tag
+        tags = defaultdict(list)
+        for row in Recipe.tags.through.objects.filter(
+                recipe_id__in=ids
+        ).order_by(
+            *(f'tag__{field}' for field in Tag._meta.ordering)
+        ).values('recipe_id', *plan.lookups):
+            tags[row['recipe_id']].append(plan.build(row))
+        return tags
+
+    def load_ingredients(self, ids):
+        plan = self.get_plan().ingredient
+        ingredients = defaultdict(list)
+        for row in IngredientsAmount.objects.filter(
+                recipe_id__in=ids
+        ).values('recipe_id', *plan.lookups):
+            ingredients[row['recipe_id']].append(plan.build(row))
+        return ingredients
+
+    def build(self, rows, tags, ingredients, relations):
+        """Собирает ответ из уже загруженных частей.
+
+        Части независимы друг от друга, поэтому асинхронные обработчики
+        загружают их параллельно.
+        """
+        build = self.get_plan().build
+        context = {
+            'request': self.context.get('request'),
+            'relations': relations,
+            'tags': tags,
+            'ingredients': ingredients,
+        }
+        return [build(row, context) for row in rows]
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        if not rows:
+            return []
+        ids = [row['id'] for row in rows]
+        return self.build(
+            rows,
+            self.load_tags(ids),
+            self.load_ingredients(ids),
+            get_relations(self.context.get('request')),
+        )
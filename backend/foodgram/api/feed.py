@@ -0,0 +1,64 @@
+import heapq
+
+from django.conf import settings
+
+from recipes.models import Recipe
+
+from .cache import get_cache
+
+AUTHOR_RECIPES_KEY = 'api:feed:author:{}'
+
+
+def get_author_recipes(author_ids):
+    """Последние рецепты авторов: {id автора: [(дата, id рецепта)]}.
+
+    Списки кэшируются и сбрасываются сигналами при изменении рецептов
+    автора.
+    """
+    cache = get_cache()
+    keys = {AUTHOR_RECIPES_KEY.format(author_id): author_id
+            for author_id in author_ids}
+    recipes = {
+        keys[key]: value for key, value in cache.get_many(keys).items()
+    }
+    missing = {}
+    for key, author_id in keys.items():
+        if author_id not in recipes:
+            recipes[author_id] = missing[key] = list(
+                Recipe.objects.filter(author_id=author_id).order_by(
+                    '-pub_date', '-id'
+                ).values_list('pub_date', 'pk')[
+                    :settings.FEED_TIMELINE_LENGTH])
+    if missing:
+        cache.set_many(missing, settings.FEED_AUTHOR_RECIPES_TIMEOUT)
+    return recipes
+
+
+def invalidate_author_recipes(author_id):
+    get_cache().delete(AUTHOR_RECIPES_KEY.format(author_id))
+
+
+def get_feed(user):
+    """id рецептов ленты подписок пользователя, новые первыми.
+
+    Лента пользователя, заполненная при публикации рецептов, сливается
+    k-путевым слиянием со списками популярных авторов из подписок. Рецепт
+    может попасть в оба источника, если автор стал популярным после
+    публикации, поэтому повторы пропускаются.
+    """
+    length = settings.FEED_TIMELINE_LENGTH
+    timeline = user.timeline.values_list('pub_date', 'recipe_id')[:length]
+    authors = get_author_recipes(user.follower.filter(
+        author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('author_id', flat=True))
+    feed = []
+    seen = set()
+    for _, recipe_id in heapq.merge(
+            timeline, *authors.values(), reverse=True):
+        if recipe_id in seen:
+            continue
+        seen.add(recipe_id)
+        feed.append(recipe_id)
+        if len(feed) == length:
+            break
+    return feed
@@ -1,16 +1,34 @@
+from django.db.models import Exists, F, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
+                            Tag)
 from users.models import User
 
+from .search import search_ingredients, search_recipes
+
+RECIPE_ORDERINGS = {
+    'newest': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-pub_date', '-id'),
+    'cooking_time': ('cooking_time', '-pub_date', '-id'),
+    # Рецепты без данных о пищевой ценности - в конце списка.
+    'calories': (F('nutrition__calories_per_serving').asc(nulls_last=True),
+                 '-pub_date', '-id'),
+    'price': (F('nutrition__price_per_serving').asc(nulls_last=True),
+              '-pub_date', '-id'),
+}
+
 
 class IngredientsFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='icontains')
+    name = filters.CharFilter(method='search_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def search_name(self, queryset, name, value):
+        return search_ingredients(queryset, value)
+
 
 class RecipesFilter(FilterSet):
     author = filters.ModelChoiceFilter(
@@ -19,7 +37,8 @@ class RecipesFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name='tags__slug',
-        to_field_name='slug'
+        to_field_name='slug',
+        method='filter_tags'
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
@@ -27,19 +46,55 @@ class RecipesFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
     )
+    calories_min = filters.NumberFilter(
+        field_name='nutrition__calories_per_serving', lookup_expr='gte')
+    calories_max = filters.NumberFilter(
+        field_name='nutrition__calories_per_serving', lookup_expr='lte')
+    price_min = filters.NumberFilter(
+        field_name='nutrition__price_per_serving', lookup_expr='gte')
+    price_max = filters.NumberFilter(
+        field_name='nutrition__price_per_serving', lookup_expr='lte')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(
+            ('newest', 'Сначала новые'),
+            ('popular', 'Сначала популярные'),
+            ('cooking_time', 'Сначала быстрые'),
+            ('calories', 'Сначала менее калорийные'),
+            ('price', 'Сначала дешёвые'),
+        ),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
 
-    def get_is_favorited(self, queryset, value):
-        user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(recipe__user=user)
-        return queryset
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=value
+        )))
 
-    def get_is_in_shopping_cart(self, queryset, value):
+    def __filter_user_relation(self, queryset, model, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(recipe_shopping_cart__user=user)
+            return queryset.filter(Exists(model.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )))
         return queryset
+
+    def get_is_favorited(self, queryset, name, value):
+        return self.__filter_user_relation(queryset, FavoriteRecipe, value)
+
+    def get_is_in_shopping_cart(self, queryset, name, value):
+        return self.__filter_user_relation(queryset, ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
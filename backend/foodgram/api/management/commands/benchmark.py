@@ -0,0 +1,230 @@
+import json
+import platform
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга."""
+    values = sorted(values)
+    rank = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку и число SQL-запросов основных эндпоинтов '
+            'и сохраняет результат в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare',
+                            help='JSON предыдущего запуска для сравнения.')
+        parser.add_argument('--user',
+                            help='Имя пользователя, от которого идут запросы.')
+        parser.add_argument('--only', nargs='*',
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Очищать кэш перед каждым запросом.')
+        parser.add_argument('--baseline', action='store_true',
+                            help='Без быстрой сериализации и orjson.')
+
+    def handle(self, *args, **options):
+        if options['baseline']:
+            with override_settings(API_FAST_SERIALIZERS=False,
+                                   API_JSON_BACKEND='json'):
+                return self.run(options)
+        return self.run(options)
+
+    def run(self, options):
+        user = self.get_user(options['user'])
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.clear_cache = options['no_cache']
+
+        scenarios = self.get_scenarios(user)
+        if options['only']:
+            scenarios = {
+                name: scenario for name, scenario in scenarios.items()
+                if name in options['only']
+            }
+        results = {}
+        for name, scenario in scenarios.items():
+            results[name] = self.run_scenario(
+                scenario, options['iterations'], options['warmup'])
+            self.stdout.write(self.format_result(name, results[name]))
+
+        report = {
+            'meta': self.get_meta(user, options['baseline']),
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {options["output"]}'))
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.annotate(
+                cart_size=Count('shopping_cart')
+            ).order_by('-cart_size', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, сначала выполните generate_data.')
+        return user
+
+    def get_scenarios(self, user):
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if recipe is None or tag is None or ingredient is None:
+            raise CommandError(
+                'Нет рецептов, сначала выполните generate_data.')
+        recipe_ingredients = list(
+            recipe.recipe.values('ingredient_id', 'amount'))
+        recipe_body = {
+            'name': 'Бенчмарк',
+            'text': 'Рецепт для замера производительности.',
+            'cooking_time': 10,
+            'tags': [tag.id],
+            'ingredients': [
+                {'id': row['ingredient_id'], 'amount': row['amount']}
+                for row in recipe_ingredients
+            ],
+        }
+        return {
+            'recipe_list': ('get', '/api/recipes/', None),
+            'recipe_list_tags': (
+                'get', f'/api/recipes/?tags={tag.slug}', None),
+            'recipe_list_author': (
+                'get', f'/api/recipes/?author={recipe.author_id}', None),
+            'recipe_list_favorited': (
+                'get', '/api/recipes/?is_favorited=1', None),
+            'recipe_list_in_cart': (
+                'get', '/api/recipes/?is_in_shopping_cart=1', None),
+            'recipe_list_popular': (
+                'get', '/api/recipes/?ordering=popular', None),
+            'recipe_detail': ('get', f'/api/recipes/{recipe.id}/', None),
+            'subscriptions': (
+                'get', '/api/users/subscriptions/?recipes_limit=3', None),
+            'shopping_list': ('get', '/api/recipes/shopping_list/', None),
+            'download_shopping_cart': (
+                'get', '/api/recipes/download_shopping_cart/', None),
+            'ingredient_search': (
+                'get', f'/api/ingredients/?name={ingredient.name[:3]}', None),
+            'recipe_create': ('post', '/api/recipes/', recipe_body),
+        }
+
+    def request(self, method, url, body):
+        if self.clear_cache:
+            caches[settings.API_CACHE_ALIAS].clear()
+        if method == 'get':
+            response = self.client.get(url)
+        else:
+            response = getattr(self.client, method)(url, body, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def cleanup(self, method, response):
+        if method == 'post' and response.status_code == 201:
+            Recipe.objects.filter(pk=response.data['id']).delete()
+
+    def run_scenario(self, scenario, iterations, warmup):
+        method, url, body = scenario
+        for _ in range(warmup):
+            self.cleanup(method, self.request(method, url, body))
+        timings = []
+        cpu_timings = []
+        queries = []
+        statuses = set()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                cpu_started = time.process_time()
+                response = self.request(method, url, body)
+                cpu_timings.append(
+                    (time.process_time() - cpu_started) * 1000)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+            statuses.add(response.status_code)
+            self.cleanup(method, response)
+        return {
+            'url': url,
+            'method': method.upper(),
+            'status': sorted(statuses),
+            'iterations': iterations,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'min_ms': round(min(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'cpu_p50_ms': round(percentile(cpu_timings, 50), 3),
+            'cpu_mean_ms': round(sum(cpu_timings) / len(cpu_timings), 3),
+            'queries': max(queries),
+        }
+
+    def get_meta(self, user, baseline):
+        return {
+            'fast_serializers': settings.API_FAST_SERIALIZERS,
+            'json_backend': settings.API_JSON_BACKEND,
+            'baseline': baseline,
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'user': user.username,
+            'recipes': Recipe.objects.count(),
+            'users': User.objects.count(),
+            'ingredients': Ingredient.objects.count(),
+        }
+
+    def format_result(self, name, result):
+        return (
+            f'{name:<24} p50 {result["p50_ms"]:>9.2f} ms  '
+            f'p90 {result["p90_ms"]:>9.2f} ms  '
+            f'p99 {result["p99_ms"]:>9.2f} ms  '
+            f'cpu {result["cpu_p50_ms"]:>9.2f} ms  '
+            f'queries {result["queries"]:>4}  status {result["status"]}'
+        )
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+        self.stdout.write(f'\nСравнение с {path}:')
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            ratio = result['p50_ms'] / previous['p50_ms']
+            line = (
+                f'{name:<24} p50 {previous["p50_ms"]:>9.2f} -> '
+                f'{result["p50_ms"]:>9.2f} ms ({ratio:.2f}x)  '
+            )
+            if 'cpu_p50_ms' in previous:
+                cpu_ratio = result['cpu_p50_ms'] / previous['cpu_p50_ms']
+                line += (
+                    f'cpu {previous["cpu_p50_ms"]:>9.2f} -> '
+                    f'{result["cpu_p50_ms"]:>9.2f} ms ({cpu_ratio:.2f}x)  '
+                )
+            self.stdout.write(
+                line
+                + f'queries {previous["queries"]} -> {result["queries"]}')
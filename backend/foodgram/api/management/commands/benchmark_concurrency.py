@@ -0,0 +1,133 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe
+
+from .benchmark import Command as BenchmarkCommand
+from .benchmark import percentile
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенные серверы (например, gunicorn с WSGI и '
+            'uvicorn с ASGI) параллельными запросами и сравнивает '
+            'пропускную способность и задержку.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True,
+            help='Сервер в виде имя=URL, например sync=http://127.0.0.1:8000.')
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[1, 8, 32])
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на сценарий и уровень нагрузки.')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--user',
+                            help='Имя пользователя, от которого идут запросы.')
+        parser.add_argument('--only', nargs='*',
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--output', default='benchmark-concurrency.json')
+
+    def handle(self, *args, **options):
+        targets = self.parse_targets(options['target'])
+        user = BenchmarkCommand().get_user(options['user'])
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.timeout = options['timeout']
+        scenarios = self.get_scenarios()
+        if options['only']:
+            scenarios = {
+                name: url for name, url in scenarios.items()
+                if name in options['only']
+            }
+
+        results = []
+        for name, path in scenarios.items():
+            for concurrency in options['concurrency']:
+                for target, base_url in targets.items():
+                    url = base_url + path
+                    for _ in range(options['warmup']):
+                        self.fetch(url)
+                    result = self.run_load(
+                        url, concurrency, options['requests'])
+                    result.update(
+                        scenario=name, target=target,
+                        concurrency=concurrency)
+                    results.append(result)
+                    self.stdout.write(self.format_result(result))
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump({'user': user.username, 'results': results}, file,
+                      ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {options["output"]}'))
+
+    def parse_targets(self, values):
+        targets = {}
+        for value in values:
+            name, sep, url = value.partition('=')
+            if not sep or not url:
+                raise CommandError(f'Ожидается имя=URL, получено: {value}')
+            targets[name] = url.rstrip('/')
+        return targets
+
+    def get_scenarios(self):
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if recipe is None or ingredient is None:
+            raise CommandError(
+                'Нет рецептов, сначала выполните generate_data.')
+        return {
+            'recipe_detail': f'/api/recipes/{recipe.id}/',
+            'subscriptions': '/api/users/subscriptions/?recipes_limit=3',
+            'ingredient_search':
+                f'/api/ingredients/?name={quote(ingredient.name[:3])}',
+        }
+
+    def fetch(self, url):
+        request = Request(url, headers={
+            'Authorization': f'Token {self.token}',
+            'Accept': 'application/json',
+        })
+        started = time.perf_counter()
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        except (URLError, OSError):
+            status = None
+        return (time.perf_counter() - started) * 1000, status
+
+    def run_load(self, url, concurrency, requests):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(
+                lambda _: self.fetch(url), range(requests)))
+        elapsed = time.perf_counter() - started
+        timings = [timing for timing, _ in results]
+        errors = sum(1 for _, status in results if status != 200)
+        return {
+            'url': url,
+            'requests': requests,
+            'errors': errors,
+            'rps': round(requests / elapsed, 1),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+        }
+
+    def format_result(self, result):
+        return (
+            f'{result["scenario"]:<18} {result["target"]:<8} '
+            f'c={result["concurrency"]:<4} {result["rps"]:>8.1f} req/s  '
+            f'p50 {result["p50_ms"]:>9.2f} ms  '
+            f'p99 {result["p99_ms"]:>9.2f} ms  errors {result["errors"]}'
+        )
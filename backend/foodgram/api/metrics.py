@@ -0,0 +1,191 @@
+import bisect
+import contextvars
+import functools
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from rest_framework.serializers import BaseSerializer
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2)
+TOP_DUPLICATES = 10
+
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+SQL_IN_LISTS = re.compile(r'\bIN \((?:%s, )*%s\)')
+
+current_request = contextvars.ContextVar('api_metrics_request', default=None)
+
+
+def get_fingerprint(sql):
+    """Нормализует SQL: литералы и списки IN заменяются заглушками."""
+    sql = SQL_LITERALS.sub('%s', sql)
+    return SQL_IN_LISTS.sub('IN (...)', sql)
+
+
+class RequestMetrics:
+    """Метрики одного запроса: SQL-запросы и время сериализации."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[get_fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {
+            sql: count for sql, count in self.fingerprints.most_common()
+            if count > 1
+        }
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def as_dict(self):
+        labels = [str(bucket) for bucket in self.buckets] + ['+Inf']
+        return {'buckets': dict(zip(labels, self.counts)), 'sum': self.total}
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.latency = Histogram(LATENCY_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_time = Histogram(LATENCY_BUCKETS_MS)
+        self.serializer_time = Histogram(LATENCY_BUCKETS_MS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.duplicates = Counter()
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'latency_ms': self.latency.as_dict(),
+            'queries': self.queries.as_dict(),
+            'sql_time_ms': self.sql_time.as_dict(),
+            'serializer_time_ms': self.serializer_time.as_dict(),
+            'response_size': self.response_size.as_dict(),
+            'duplicate_queries': dict(
+                self.duplicates.most_common(TOP_DUPLICATES)),
+        }
+
+
+class MetricsRegistry:
+    """Агрегированные метрики по маршрутам в пределах процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(RouteMetrics)
+
+    def record(self, route, record):
+        with self._lock:
+            metrics = self._routes[route]
+            metrics.requests += 1
+            metrics.latency.observe(record['total_ms'])
+            metrics.queries.observe(record['queries'])
+            metrics.sql_time.observe(record['sql_ms'])
+            metrics.serializer_time.observe(record['serializer_ms'])
+            if record['response_size'] is not None:
+                metrics.response_size.observe(record['response_size'])
+            metrics.duplicates.update(record['duplicate_queries'])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                route: metrics.as_dict()
+                for route, metrics in sorted(self._routes.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+registry = MetricsRegistry()
+
+
+def time_serializer(func):
+    """Добавляет время вызова к serializer_time текущего запроса.
+
+    Вложенные вызовы учитываются один раз - по самому внешнему.
+    """
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        metrics = current_request.get()
+        if metrics is None or metrics.serializer_depth:
+            return func(*args, **kwargs)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_depth -= 1
+
+    return timed
+
+
+def get_subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from get_subclasses(subclass)
+
+
+# (класс, атрибут, исходное значение) для uninstrument_serializers.
+_instrumented = []
+
+
+def instrument_serializers():
+    """Замеряет время сериализации для текущего запроса.
+
+    Обычные сериализаторы - по BaseSerializer.data, быстрые списки -
+    по to_representation и build каждого класса FastListSerializer,
+    иначе на быстром пути и при заполнении кэша время было бы нулевым.
+    Вложенные сериализаторы и ListSerializer, вызывающий data родителя,
+    учитываются один раз. Вызывается только включённым
+    QueryMetricsMiddleware.
+    """
+    from .fast_serializers import FastListSerializer
+
+    if _instrumented:
+        return
+    targets = [(BaseSerializer, 'data')] + [
+        (cls, name)
+        for cls in (FastListSerializer, *get_subclasses(FastListSerializer))
+        for name in ('to_representation', 'build')
+        if name in vars(cls)
+    ]
+    for cls, name in targets:
+        original = vars(cls)[name]
+        _instrumented.append((cls, name, original))
+        if isinstance(original, property):
+            setattr(cls, name, property(time_serializer(original.fget)))
+        else:
+            setattr(cls, name, time_serializer(original))
+
+
+def uninstrument_serializers():
+    """Возвращает сериализаторам исходные методы."""
+    while _instrumented:
+        cls, name, original = _instrumented.pop()
+        setattr(cls, name, original)
@@ -0,0 +1,75 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import (RequestMetrics, current_request, instrument_serializers,
+                      registry)
+
+logger = logging.getLogger('api.metrics')
+
+
+def get_route(request):
+    match = request.resolver_match
+    if match is None:
+        return None
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{match.url_name or match.route}:{action}'
+
+
+class QueryMetricsMiddleware:
+    """Считает SQL-запросы, время и размер ответа для каждого маршрута.
+
+    Включается настройкой API_METRICS_ENABLED. Результат отдаётся в
+    заголовке Server-Timing и агрегируется для /api/metrics/, при
+    API_METRICS_LOG ещё и пишется в лог api.metrics.
+    """
+
+    def __init__(self, get_response):
+        if not settings.API_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        instrument_serializers()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        total = time.perf_counter() - started
+
+        route = get_route(request)
+        if route is None:
+            return response
+        record = {
+            'route': route,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 3),
+            'queries': metrics.queries,
+            'sql_ms': round(metrics.sql_time * 1000, 3),
+            'serializer_ms': round(metrics.serializer_time * 1000, 3),
+            'response_size': (None if response.streaming
+                              else len(response.content)),
+            'duplicate_queries': metrics.duplicates,
+        }
+        registry.record(route, record)
+        if settings.API_METRICS_LOG:
+            logger.info(json.dumps(record, ensure_ascii=False))
+        response['Server-Timing'] = (
+            f'db;dur={record["sql_ms"]};desc="{metrics.queries} queries", '
+            f'serializer;dur={record["serializer_ms"]}, '
+            f'total;dur={record["total_ms"]}'
+        )
+        return response
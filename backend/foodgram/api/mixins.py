@@ -1,10 +1,20 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, urlencode
 from rest_framework import mixins, serializers, status, viewsets
 from rest_framework.response import Response
 
-from recipes.models import Follow, Recipe
+from recipes.models import Recipe
 from users.models import User
 
+from .cache import get_cache, get_response_key, get_version, make_etag
+from .pagination import get_keyset_ordering
+from .relations import get_relations
+
 
 class CreateDestroyViewSet(mixins.CreateModelMixin,
                            mixins.DestroyModelMixin,
@@ -12,19 +22,165 @@ class CreateDestroyViewSet(mixins.CreateModelMixin,
     pass
 
 
+class CachedReadOnlyMixin:
+    """Отдаёт готовый JSON из кэша с поддержкой 304.
+
+    Кэш версионируется по ``cache_namespace``: версия меняется
+    сигналами при записи моделей, старые ключи просто перестают читаться.
+    Ключ строится по пути и отсортированным непустым параметрам запроса.
+    ``cache_control`` добавляет заголовок Cache-Control для прокси.
+    """
+
+    cache_namespace = None
+    cache_timeout = None
+    cache_control = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def should_cache(self, request):
+        return request.accepted_renderer.format == 'json'
+
+    def get_cache_path(self, request):
+        params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            for value in values
+            if value != ''
+        )
+        return f'{request.path}?{urlencode(params)}'
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if not self.should_cache(request):
+            return handler(request, *args, **kwargs)
+        renderer = request.accepted_renderer
+        version = get_version(self.cache_namespace)
+        key = get_response_key(
+            self.cache_namespace, version, self.get_cache_path(request))
+        cache = get_cache()
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context()
+            )
+            cached = (body, make_etag(body))
+            timeout = self.cache_timeout
+            if timeout is None:
+                timeout = settings.API_CACHE_TIMEOUT
+            cache.set(key, cached, timeout)
+        body, etag = cached
+        last_modified = version // 1000000
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type += f'; charset={renderer.charset}'
+            response = HttpResponse(body, content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if self.cache_control:
+            patch_cache_control(response, **self.cache_control)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class FastListMixin:
+    """list через values() и FastListSerializer вместо ModelSerializer.
+
+    Включается настройкой API_FAST_SERIALIZERS, ответ совпадает с
+    ответом обычного сериализатора.
+    """
+
+    fast_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if (self.fast_serializer_class is None
+                or not settings.API_FAST_SERIALIZERS):
+            return super().list(request, *args, **kwargs)
+        serializer = self.fast_serializer_class(
+            context=self.get_serializer_context())
+        ordering = get_keyset_ordering(self) or ()
+        lookups = dict.fromkeys(
+            (*serializer.lookups, *(field.lstrip('-') for field in ordering)))
+        queryset = self.filter_queryset(
+            self.get_queryset()
+        ).prefetch_related(None).values(*lookups)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                serializer.to_representation(page))
+        return Response(serializer.to_representation(queryset))
+
+
 class FollowMixin:
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        user_id = obj.id if isinstance(obj, User) else obj.author.id
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
+        user_id = obj.id if isinstance(obj, User) else obj.author_id
+        return user_id in get_relations(self.context.get('request')).following
+
+
+def is_unique_violation(error, model, name):
+    """Нарушено ли уникальное ограничение ``name`` модели.
 
-        request_user = self.context.get('request').user.id
-        queryset = Follow.objects.filter(author=user_id,
-                                         user=request_user).exists()
-        return queryset
+    PostgreSQL сообщает имя ограничения, SQLite — только его столбцы
+    после двоеточия, их набор и сравнивается.
+    """
+    diag = getattr(error.__cause__, 'diag', None)
+    if diag is not None:
+        return diag.constraint_name == name
+    constraint, = (
+        constraint for constraint in model._meta.constraints
+        if constraint.name == name)
+    columns = {
+        f'{model._meta.db_table}.{model._meta.get_field(field).column}'
+        for field in constraint.fields
+    }
+    message = str(error)
+    return 'UNIQUE' in message.upper() and columns == {
+        column.strip() for column in message.rpartition(':')[2].split(',')}
 
 
-class BaseClassViewSets(CreateDestroyViewSet):
+class UniqueCreateMixin:
+    """Создание связи без предварительной проверки на дубликат.
+
+    Повтор отсекает уникальное ограничение ``unique_constraint``
+    сериализатора, его IntegrityError превращается в ошибку валидации
+    из ``unique_error``. Остальные ошибки целостности не глушатся.
+    """
+
+    def save_unique(self, serializer, **kwargs):
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError as error:
+            if not is_unique_violation(
+                    error,
+                    serializer.Meta.model,
+                    serializer.unique_constraint):
+                raise
+            # Та же форма, что у ошибки из validate(): сообщения списком,
+            # строка - под non_field_errors.
+            raise serializers.ValidationError(
+                serializers.as_serializer_error(
+                    serializers.ValidationError(serializer.unique_error)))
+
+
+class BaseClassViewSets(UniqueCreateMixin, CreateDestroyViewSet):
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -32,9 +188,9 @@ class BaseClassViewSets(CreateDestroyViewSet):
         return context
 
     def perform_create(self, serializer):
-        user = self.request.user
-        serializer.save(
-            user=user,
+        self.save_unique(
+            serializer,
+            user=self.request.user,
             recipe=get_object_or_404(
                 Recipe,
                 id=self.kwargs.get('recipe_id')
@@ -42,14 +198,13 @@ class BaseClassViewSets(CreateDestroyViewSet):
         )
 
     def destroy(self, request, recipe_id, model):
-        user = request.user
-        if not model.objects.filter(
-                user=user,
-                recipe_id=recipe_id).exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        get_object_or_404(
-            model,
-            user=user,
-            recipe=recipe_id
+        # Один вызов delete() без проверки exists(), но не один запрос:
+        # из-за receivers post_delete Django сначала выбирает строки,
+        # затем сигналы пересчитывают счётчики и список покупок.
+        deleted, _ = model.objects.filter(
+            user=request.user,
+            recipe_id=recipe_id
         ).delete()
+        if not deleted:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,6 +1,191 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ApproximatePage(Page):
+    has_more = False
+
+    def has_next(self):
+        return self.has_more
+
+
+class ApproximateCountPaginator(Paginator):
+    """Пагинатор без точного COUNT(*).
+
+    На PostgreSQL количество берётся из оценки планировщика, наличие
+    следующей страницы определяется выборкой на одну запись больше.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        # Лента и подбор по ингредиентам пагинируют список, а не QuerySet.
+        if (not isinstance(queryset, QuerySet)
+                or connections[queryset.db].vendor != 'postgresql'):
+            return super().count
+        connection = connections[queryset.db]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        return plan[0]['Plan']['Plan Rows']
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise EmptyPage('Номер страницы должен быть целым числом.')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1.')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage('Страница не содержит результатов.')
+        page = ApproximatePage(object_list[:self.per_page], number, self)
+        page.has_more = len(object_list) > self.per_page
+        return page
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по набору полей, например (pub_date, id).
+
+    Следующая страница выбирается условием по ключу последней записи,
+    без OFFSET и без COUNT(*). Поддерживается движение только вперёд.
+    """
+
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.get_position_filter(cursor))
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last = results[-1] if results else None
+        return results
+
+    def get_position_filter(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            fields = [
+                self.model._meta.get_field(field.lstrip('-'))
+                for field in self.ordering
+            ]
+            values = [
+                field.to_python(value) for field, value in zip(fields, values)
+            ]
+        except Exception:
+            raise NotFound('Некорректный курсор.')
+        position = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            position |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return position
+
+    def encode_cursor(self, instance):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if isinstance(instance, dict):
+                value = instance[name]
+            else:
+                value = getattr(instance, name)
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
+
+
+def get_keyset_ordering(view):
+    """Сортировка курсорного режима для текущего действия представления.
+
+    ``keyset_orderings`` задаёт сортировку действия по умолчанию.
+    Представление может уточнить её методом ``get_keyset_ordering`` по
+    активной сортировке запроса или вернуть None, если курсор по ней
+    построить нельзя.
+    """
+    ordering = getattr(view, 'keyset_orderings', {}).get(
+        getattr(view, 'action', None))
+    if ordering and hasattr(view, 'get_keyset_ordering'):
+        return view.get_keyset_ordering(ordering)
+    return ordering
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная пагинация с курсорным режимом по запросу.
+
+    Курсорный режим включается параметром ``pagination=cursor`` (или
+    переданным ``cursor``) для действий, перечисленных во
+    ``keyset_orderings`` представления. Параметр ``approximate_count``
+    отключает точный подсчёт записей в постраничном режиме.
+    """
+
     page_size = 6
     page_size_query_param = 'page_size'
+    pagination_query_param = 'pagination'
+    approximate_count_query_param = 'approximate_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        params = request.query_params
+        cursor_mode = (
+            params.get(self.pagination_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in params)
+        if cursor_mode and (getattr(view, 'action', None)
+                            in getattr(view, 'keyset_orderings', {})):
+            ordering = get_keyset_ordering(view)
+            if ordering is None:
+                raise ValidationError({
+                    self.pagination_query_param: [
+                        'Курсорная пагинация недоступна для этой '
+                        'сортировки или поиска.']})
+            self.keyset = KeysetPagination(
+                ordering, self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.django_paginator_class = Paginator
+        if params.get(self.approximate_count_query_param) in ('1', 'true'):
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
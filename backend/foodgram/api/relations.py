@@ -0,0 +1,68 @@
+from django.conf import settings
+
+from recipes.models import FavoriteRecipe, Follow, ShoppingCart
+
+from .cache import get_cache
+
+RELATIONS_KEY = 'api:relations:{}'
+REQUEST_ATTRIBUTE = '_user_relations'
+
+
+class UserRelations:
+    """Связи пользователя с рецептами и авторами в виде множеств id."""
+
+    __slots__ = ('favorites', 'shopping_cart', 'following')
+
+    def __init__(self, favorites=(), shopping_cart=(), following=()):
+        self.favorites = frozenset(favorites)
+        self.shopping_cart = frozenset(shopping_cart)
+        self.following = frozenset(following)
+
+    def __getstate__(self):
+        return self.favorites, self.shopping_cart, self.following
+
+    def __setstate__(self, state):
+        self.favorites, self.shopping_cart, self.following = state
+
+
+ANONYMOUS_RELATIONS = UserRelations()
+
+
+def load_relations(user):
+    return UserRelations(
+        favorites=FavoriteRecipe.objects.filter(
+            user=user).values_list('recipe_id', flat=True),
+        shopping_cart=ShoppingCart.objects.filter(
+            user=user).values_list('recipe_id', flat=True),
+        following=Follow.objects.filter(
+            user=user).values_list('author_id', flat=True),
+    )
+
+
+def get_user_relations(user):
+    """Связи пользователя из кэша или из базы тремя запросами."""
+    timeout = settings.API_RELATIONS_CACHE_TIMEOUT
+    if not timeout:
+        return load_relations(user)
+    cache = get_cache()
+    key = RELATIONS_KEY.format(user.pk)
+    relations = cache.get(key)
+    if relations is None:
+        relations = load_relations(user)
+        cache.set(key, relations, timeout)
+    return relations
+
+
+def get_relations(request):
+    """Связи текущего пользователя, загружаемые один раз за запрос."""
+    if request is None or not request.user.is_authenticated:
+        return ANONYMOUS_RELATIONS
+    relations = getattr(request, REQUEST_ATTRIBUTE, None)
+    if relations is None:
+        relations = get_user_relations(request.user)
+        setattr(request, REQUEST_ATTRIBUTE, relations)
+    return relations
+
+
+def invalidate_relations(user_id):
+    get_cache().delete(RELATIONS_KEY.format(user_id))
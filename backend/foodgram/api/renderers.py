@@ -0,0 +1,168 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SHOPPING_LIST_TITLE = 'Список покупок:'
+# json экранирует разделители строк, orjson - нет.
+LINE_SEPARATORS = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer с кодировщиком из настройки API_JSON_BACKEND.
+
+    С ``orjson`` вывод совпадает с JSONRenderer побайтно: компактные
+    разделители, UTF-8 без экранирования, U+2028/U+2029 экранируются.
+    Если orjson не установлен, нужны отступы или ASCII, а также для
+    значений, которые orjson не кодирует, используется json из stdlib.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None
+                or settings.API_JSON_BACKEND != 'orjson'
+                or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type,
+                                   renderer_context or {})):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except TypeError:
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        for separator, escaped in LINE_SEPARATORS:
+            ret = ret.replace(separator, escaped)
+        return ret
+
+
+def get_error_message(data):
+    """Текст ошибки DRF без repr: ``detail`` или все сообщения подряд."""
+    if isinstance(data, dict):
+        data = data['detail'] if 'detail' in data else list(data.values())
+    if isinstance(data, (list, tuple)):
+        return ' '.join(get_error_message(item) for item in data)
+    return str(data)
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Строки списка отдаются генератором ``stream``, чтобы ответ можно было
+    передавать через StreamingHttpResponse, не собирая его в памяти.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Через render проходят только ответы-ошибки, сам список
+        # отдаётся потоком из stream.
+        return b''.join(self.stream((), message=get_error_message(data)))
+
+    def stream(self, items, message=None):
+        raise NotImplementedError
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items, message=None):
+        if message is not None:
+            yield message.encode(self.charset)
+            return
+        yield f'{SHOPPING_LIST_TITLE}\n\n'.encode(self.charset)
+        for item in items:
+            yield (
+                f'{item["name"]} ({item["measurement_unit"]})'
+                f' — {item["total"]}\n'
+            ).encode(self.charset)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items, message=None):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if message is not None:
+            writer.writerow((message,))
+        else:
+            writer.writerow(('Ингредиент', 'Ед. измерения', 'Количество'))
+        for item in items:
+            writer.writerow(
+                (item['name'], item['measurement_unit'], item['total']))
+            yield self._drain(buffer)
+        yield self._drain(buffer)
+
+    def _drain(self, buffer):
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value.encode(self.charset)
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+    chunk_size = 64 * 1024
+
+    def stream(self, items, message=None):
+        buffer = io.BytesIO()
+        font = self._get_font()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        y = height - self.margin
+        pdf.setFont(font, self.font_size + 4)
+        pdf.drawString(self.margin, y, message or SHOPPING_LIST_TITLE)
+        y -= self.line_height * 2
+        pdf.setFont(font, self.font_size)
+        for item in items:
+            if y < self.margin:
+                pdf.showPage()
+                pdf.setFont(font, self.font_size)
+                y = height - self.margin
+            pdf.drawString(
+                self.margin, y,
+                f'{item["name"]} ({item["measurement_unit"]})'
+                f' — {item["total"]}'
+            )
+            y -= self.line_height
+        pdf.save()
+        buffer.seek(0)
+        chunk = buffer.read(self.chunk_size)
+        while chunk:
+            yield chunk
+            chunk = buffer.read(self.chunk_size)
+
+    def _get_font(self):
+        if self.font_name in pdfmetrics.getRegisteredFontNames():
+            return self.font_name
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if not os.path.exists(font_path):
+            return 'Helvetica'
+        pdfmetrics.registerFont(TTFont(self.font_name, font_path))
+        return self.font_name
@@ -0,0 +1,157 @@
+import bisect
+import operator
+import threading
+from functools import reduce
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import (BooleanField, Case, FloatField, IntegerField,
+                              Max, OuterRef, Q, Subquery, Sum, Value, When)
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Ingredient, Recipe, RecipeSearchToken
+from recipes.search import tokenize, uses_search_vector
+
+from .cache import get_version
+
+
+def get_trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Используется на БД без pg_trgm (SQLite при разработке и в тестах):
+    префиксы ищутся бинарным поиском по отсортированному списку,
+    подстроки - по пересечению триграмм. Индекс перестраивается, когда
+    меняется версия кэша ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    def _get_data(self):
+        version = get_version('ingredients')
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._data = self._build()
+                    self._version = version
+        return self._data
+
+    def _build(self):
+        names = sorted(
+            (name.lower(), pk)
+            for pk, name in Ingredient.objects.values_list('id', 'name')
+        )
+        trigrams = {}
+        for position, (name, pk) in enumerate(names):
+            for trigram in get_trigrams(name):
+                trigrams.setdefault(trigram, set()).add(position)
+        return names, trigrams
+
+    def search(self, value, limit):
+        names, trigrams = self._get_data()
+        value = value.lower()
+        result = []
+        position = bisect.bisect_left(names, (value,))
+        while (position < len(names) and len(result) < limit
+               and names[position][0].startswith(value)):
+            result.append(names[position][1])
+            position += 1
+        if len(result) == limit:
+            return result
+
+        query_trigrams = get_trigrams(value)
+        if query_trigrams:
+            candidates = set.intersection(*(
+                trigrams.get(trigram, set()) for trigram in query_trigrams
+            ))
+        else:
+            candidates = range(len(names))
+        found = set(result)
+        for position in sorted(candidates):
+            name, pk = names[position]
+            if value in name and pk not in found:
+                result.append(pk)
+                if len(result) == limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_ingredients(queryset, value, limit=None):
+    """Ищет ингредиенты по названию: сначала префиксы, затем подстроки."""
+    limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+    if connections[queryset.db].vendor == 'postgresql':
+        ordering = (Case(
+            When(name__istartswith=value, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ), 'name')
+        matches = queryset.filter(
+            name__icontains=value
+        ).order_by(*ordering).values('pk')[:limit]
+        return queryset.filter(pk__in=Subquery(matches)).order_by(*ordering)
+    ids = ingredient_index.search(value, limit)
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *(When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ids)),
+        output_field=IntegerField(),
+    ))
+
+
+RECIPE_SEARCH_ORDERING = ('-search_rank', '-pub_date', '-id')
+
+
+def get_token_prefix_filter(term):
+    # Диапазон вместо LIKE: по нему работает индекс (token, recipe).
+    return Q(token__gte=term, token__lt=term + '\uffff')
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+    Каждое слово запроса ищется как префикс, рецепт должен содержать все
+    слова. Результат упорядочен по релевантности: совпадение в названии
+    весит больше, чем в ингредиентах, а в ингредиентах - больше, чем в
+    описании.
+    """
+    terms = list(dict.fromkeys(tokenize(value)))[
+        :settings.RECIPE_SEARCH_MAX_TERMS]
+    if not terms:
+        return queryset.none()
+    if uses_search_vector(queryset.db):
+        vector = f'"{Recipe._meta.db_table}"."search_vector"'
+        params = (settings.RECIPE_SEARCH_CONFIG,
+                  ' & '.join(f'{term}:*' for term in terms))
+        return queryset.filter(RawSQL(
+            f'{vector} @@ to_tsquery(%s, %s)', params,
+            output_field=BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank({vector}, to_tsquery(%s, %s))', params,
+            output_field=FloatField()
+        )).order_by(*RECIPE_SEARCH_ORDERING)
+
+    conditions = [get_token_prefix_filter(term) for term in terms]
+    matched_terms = reduce(operator.add, (
+        Max(Case(When(condition, then=Value(1)), default=Value(0),
+                 output_field=IntegerField()))
+        for condition in conditions
+    ))
+    matches = RecipeSearchToken.objects.filter(
+        reduce(operator.or_, conditions)
+    ).values('recipe_id').annotate(
+        rank=Sum('weight'), matched_terms=matched_terms
+    ).filter(matched_terms=len(terms))
+    return queryset.filter(
+        pk__in=matches.values('recipe_id')
+    ).annotate(search_rank=Subquery(
+        matches.filter(recipe_id=OuterRef('pk')).values('rank'),
+        output_field=FloatField()
+    )).order_by(*RECIPE_SEARCH_ORDERING)
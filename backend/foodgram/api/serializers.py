@@ -1,16 +1,46 @@
 import base64
+import binascii
+import re
+import tempfile
 
+from django.conf import settings
 from django.contrib.auth.hashers import check_password
-from django.core.files.base import ContentFile
+from django.core.files.base import File
+from django.db import transaction
 from djoser.serializers import (PasswordSerializer, UserCreateSerializer,
                                 UserSerializer)
+
+from PIL import Image, UnidentifiedImageError
 from rest_framework import serializers
 
+from recipes.images import get_variant_urls
 from recipes.models import (FavoriteRecipe, Follow, Ingredient,
-                            IngredientsAmount, Recipe, ShoppingCart, Tag)
+                            IngredientsAmount, Recipe, RecipeNutrition,
+                            ShoppingCart, ShoppingListItem, SimilarRecipe,
+                            Tag)
 from users.models import User
 
 from .mixins import FollowMixin
+from .relations import get_relations
+
+
+def get_image_variant_urls(name, ready, request=None):
+    urls = get_variant_urls(name, ready)
+    if urls and request is not None:
+        urls = {
+            variant: url and request.build_absolute_uri(url)
+            for variant, url in urls.items()
+        }
+    return urls
+
+
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit или None, если он не задан."""
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return max(limit, 0)
 
 
 class AllUserSerializer(UserSerializer, FollowMixin):
@@ -70,6 +100,22 @@ class IngredientsAmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(
+        source='ingredient.id',
+    )
+    name = serializers.ReadOnlyField(
+        source='ingredient.name',
+    )
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit',
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -89,31 +135,32 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     author = AllUserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time', 'servings'
         )
 
-    def __check_model(self, obj, model):
-        request = self.context.get('request')
-        return (request.user.is_authenticated and model.objects.filter(
-            user=request.user,
-            recipe=obj
-        ).exists())
+    def get_image_variants(self, obj):
+        return get_image_variant_urls(
+            obj.image.name, obj.image_variant_files,
+            self.context.get('request'))
 
     def get_is_favorited(self, obj):
-        return self.__check_model(obj, FavoriteRecipe)
+        return obj.id in get_relations(self.context.get('request')).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        return self.__check_model(obj, ShoppingCart)
+        relations = get_relations(self.context.get('request'))
+        return obj.id in relations.shopping_cart
 
 
 class IngredientsAddSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
-    amount = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = Ingredient
@@ -121,15 +168,69 @@ class IngredientsAddSerializer(serializers.ModelSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+    """Изображение в base64, декодируемое по частям.
+
+    Размер проверяется до декодирования, размеры картинки - по заголовку,
+    как только он прочитан. Имя файла по хэшу содержимого задаёт
+    хранилище изображений рецептов.
+    """
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+    chunk_size = 64 * 1024
+    header = re.compile(r'data:image/(\w+);base64,')
+    whitespace = re.compile(r'\s+')
 
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('data:image'):
+            data = self.decode(data)
         return super().to_internal_value(data)
 
+    def decode(self, data):
+        match = self.header.match(data)
+        if match is None:
+            self.fail('invalid_image')
+        start = match.end()
+        if (len(data) - start) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Размер изображения не должен превышать '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE} байт.')
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        checked = False
+        # Base64 с переносами строк (MIME) декодируется по 4 символа,
+        # поэтому остаток части без пробелов переносится в следующую.
+        tail = ''
+        for position in range(start, len(data), self.chunk_size):
+            encoded = tail + self.whitespace.sub(
+                '', data[position:position + self.chunk_size])
+            size = len(encoded) - len(encoded) % 4
+            tail = encoded[size:]
+            try:
+                chunk = base64.b64decode(encoded[:size])
+            except (binascii.Error, ValueError):
+                self.fail('invalid_image')
+            file.write(chunk)
+            if not checked:
+                checked = self.check_dimensions(file)
+        if tail:
+            self.fail('invalid_image')
+        file.seek(0)
+        return File(file, name=f'image.{match.group(1)}')
+
+    def check_dimensions(self, file):
+        position = file.tell()
+        file.seek(0)
+        try:
+            width, height = Image.open(file).size
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            return False
+        finally:
+            file.seek(position)
+        if max(width, height) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+            raise serializers.ValidationError(
+                'Сторона изображения не должна превышать '
+                f'{settings.RECIPE_IMAGE_MAX_DIMENSION} пикселей.')
+        return True
+
 
 class RecipeCreatUpdateSerializer(serializers.ModelSerializer):
     ingredients = IngredientsAddSerializer(
@@ -144,48 +245,146 @@ class RecipeCreatUpdateSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = '__all__'
 
+    def validate_ingredients(self, ingredients):
+        ids = [item['id'] for item in ingredients]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться.')
+        found = set(Ingredient.objects.filter(
+            id__in=ids).order_by().values_list('id', flat=True))
+        missing = sorted(set(ids) - found)
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}')
+        return ingredients
+
     def create_ingredients(self, ingredients, recipe):
-        for i in ingredients:
-            ingredient = Ingredient.objects.get(id=i['id'])
-            IngredientsAmount.objects.create(
-                ingredient=ingredient, recipe=recipe, amount=i['amount']
+        IngredientsAmount.objects.bulk_create(
+            IngredientsAmount(
+                recipe=recipe, ingredient_id=item['id'],
+                amount=item['amount']
             )
+            for item in ingredients
+        )
 
+    def update_ingredients(self, ingredients, recipe):
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        existing = {
+            row.ingredient_id: row
+            for row in IngredientsAmount.objects.filter(recipe=recipe)
+        }
+        removed = [
+            row.id for ingredient_id, row in existing.items()
+            if ingredient_id not in amounts
+        ]
+        if removed:
+            IngredientsAmount.objects.filter(id__in=removed).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientsAmount.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients(
+            [item for item in ingredients if item['id'] not in existing],
+            recipe
+        )
+        # Новые и удалённые ингредиенты плюс изменившие количество.
+        affected = (set(amounts) ^ set(existing)) | {
+            row.ingredient_id for row in changed}
+        if affected:
+            ShoppingListItem.objects.rebuild(
+                ShoppingCart.objects.filter(
+                    recipe=recipe).values_list('user_id', flat=True),
+                affected
+            )
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
+        recipe.tags.add(*tags)
         self.create_ingredients(ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
+            self.update_ingredients(
+                validated_data.pop('ingredients'), instance)
         if 'tags' in validated_data:
             instance.tags.set(validated_data.pop('tags'))
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        request = self.context['request']
+        instance = Recipe.objects.with_related().get(pk=instance.pk)
         return RecipeGetSerializer(
             instance,
             context={
-                'request': self.context['request']
+                'request': request
             }).data
 
 
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit')
 
 
 class FollowRecipeSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+    def get_image_variants(self, obj):
+        return get_image_variant_urls(
+            obj.image.name, obj.image_variant_files,
+            self.context.get('request'))
+
+
+def get_similar_recipes(recipe_id, request=None):
+    recipes = [
+        similar.similar
+        for similar in SimilarRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).select_related('similar')[:settings.SIMILAR_RECIPES_TOP_K]
+    ]
+    return FollowRecipeSerializer(
+        recipes, many=True, context={'request': request}).data
+
+
+class RecipeNutritionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecipeNutrition
+        exclude = ('recipe',)
+
+
+def get_recipe_nutrition(recipe_id):
+    nutrition = RecipeNutrition.objects.filter(recipe_id=recipe_id).first()
+    if nutrition is None:
+        return None
+    return RecipeNutritionSerializer(nutrition).data
+
+
+class RecipeDetailSerializer(RecipeGetSerializer):
+    similar_recipes = serializers.SerializerMethodField()
+    nutrition = serializers.SerializerMethodField()
+
+    class Meta(RecipeGetSerializer.Meta):
+        fields = RecipeGetSerializer.Meta.fields + (
+            'similar_recipes', 'nutrition')
+
+    def get_similar_recipes(self, obj):
+        return get_similar_recipes(obj.id, self.context.get('request'))
+
+    def get_nutrition(self, obj):
+        return get_recipe_nutrition(obj.id)
 
 
 class FollowSerializer(serializers.ModelSerializer, FollowMixin):
@@ -213,25 +412,30 @@ class FollowSerializer(serializers.ModelSerializer, FollowMixin):
         fields = ('email', 'id', 'username', 'first_name',
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count',)
 
+    unique_constraint = 'unique_author_following'
+    unique_error = 'Вы уже подписаны на данного пользователя'
+
     def validate(self, data):
         user = self.context.get('request').user
         author = self.context.get('author_id')
         if user.id == author:
-            raise serializers.ValidationError({
-                'Нельзя подписаться на самого себя'})
-        if Follow.objects.filter(user=user, author=author).exists():
-            raise serializers.ValidationError({
-                'Вы уже подписаны на данного пользователя'})
+            raise serializers.ValidationError(
+                'Нельзя подписаться на самого себя')
         return data
 
     def get_recipes(self, obj):
-        recipes = Recipe.objects.filter(author=obj.author)
+        recipes = getattr(obj.author, 'recipes_preview', None)
+        if recipes is None:
+            recipes = Recipe.objects.filter(author=obj.author)
+            limit = get_recipes_limit(self.context.get('request'))
+            if limit is not None:
+                recipes = recipes[:limit]
         return FollowRecipeSerializer(
             recipes,
             many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
 
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
@@ -253,16 +457,8 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
         model = FavoriteRecipe
         fields = ('id', 'name', 'image', 'cooking_time')
 
-    def validate(self, data):
-        user = self.context['request'].user
-        recipe_id = self.context['recipe_id']
-        if FavoriteRecipe.objects.filter(
-                user=user,
-                recipe_id=recipe_id
-        ).exists():
-            raise serializers.ValidationError({
-                'favorite_recipe_error': 'Рецепт уже в избранном'})
-        return data
+    unique_constraint = 'unique_favorite_recipe'
+    unique_error = {'favorite_recipe_error': 'Рецепт уже в избранном'}
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
@@ -284,11 +480,60 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         model = ShoppingCart
         fields = ('id', 'name', 'image', 'cooking_time')
 
-    def validate(self, data):
-        user = self.context.get('request').user
-        recipe = self.context.get('recipe_id')
-        if ShoppingCart.objects.filter(user=user,
-                                       recipe=recipe).exists():
-            raise serializers.ValidationError({
-                'errors': 'Рецепт уже добавлен в список покупок'})
-        return data
+    unique_constraint = 'unique_recipe_shopping_cart'
+    unique_error = {'errors': 'Рецепт уже добавлен в список покупок'}
+
+
+class ShoppingCartBulkSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.SHOPPING_CART_BULK_LIMIT,
+    )
+
+    def validate_recipes(self, recipes):
+        recipes = list(dict.fromkeys(recipes))
+        if self.context['request'].method != 'POST':
+            return recipes
+        found = set(Recipe.objects.filter(
+            id__in=recipes).order_by().values_list('id', flat=True))
+        missing = [pk for pk in recipes if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Рецепты не найдены: {missing}')
+        return recipes
+
+
+class CookableQuerySerializer(serializers.Serializer):
+    """Параметры запроса «что приготовить».
+
+    ``ingredients`` - id через запятую, после двоеточия можно указать
+    имеющееся количество: ``1,5:200,9``.
+    """
+
+    ingredients = serializers.CharField()
+    max_missing = serializers.IntegerField(
+        min_value=0,
+        max_value=settings.COOKABLE_MAX_MISSING,
+        default=settings.COOKABLE_DEFAULT_MAX_MISSING,
+    )
+
+    def validate_ingredients(self, value):
+        pantry = {}
+        for item in value.split(','):
+            ingredient_id, _, amount = item.strip().partition(':')
+            try:
+                ingredient_id = int(ingredient_id)
+                amount = int(amount) if amount else None
+            except ValueError:
+                raise serializers.ValidationError(
+                    f'Некорректный ингредиент: {item}')
+            if ingredient_id < 1 or (amount is not None and amount < 1):
+                raise serializers.ValidationError(
+                    f'Некорректный ингредиент: {item}')
+            pantry[ingredient_id] = amount
+        if len(pantry) > settings.COOKABLE_MAX_INGREDIENTS:
+            raise serializers.ValidationError(
+                'Не больше {} ингредиентов.'.format(
+                    settings.COOKABLE_MAX_INGREDIENTS))
+        return pantry
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db.models import F
+
+from recipes.models import ShoppingListItem
+
+
+def get_shopping_list_items(user):
+    """Строки списка покупок, поддерживаемого при изменении корзины.
+
+    Суммы уже посчитаны в ShoppingListItem, поэтому чтение не зависит
+    от числа рецептов в корзине - только от числа ингредиентов.
+    """
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).select_related(
+        'ingredient'
+    ).order_by('ingredient__name', 'ingredient_id')
+
+
+def get_shopping_list(user):
+    """Список покупок для выгрузки, читаемый серверным курсором порциями."""
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values(
+        'ingredient'
+    ).annotate(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+        total=F('amount'),
+    ).order_by('name', 'ingredient').iterator(
+        chunk_size=settings.SHOPPING_LIST_CHUNK_SIZE
+    )
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (FavoriteRecipe, Follow, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from users.models import User
+
+from .cache import bump_version
+from .cookable import record_changes, reset_cookable_index
+from .feed import invalidate_author_recipes
+from .relations import invalidate_relations
+
+
+AUTHOR_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name'))
+
+
+def bump_version_on_commit(*namespaces):
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump_version_on_commit('ingredients', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_version_on_commit('tags', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipes(**kwargs):
+    # Ингредиенты и тэги рецепта меняются вместе с сохранением самого
+    # рецепта, поэтому отдельные сигналы для них не нужны.
+    bump_version_on_commit('recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def record_recipe_change(instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: record_changes((recipe_id,)))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_feed(instance, **kwargs):
+    author_id = instance.author_id
+    transaction.on_commit(lambda: invalidate_author_recipes(author_id))
+
+
+@receiver(post_delete, sender=Ingredient)
+def reset_cookable(**kwargs):
+    # Ингредиент удаляется из рецептов каскадом, без сигналов рецептов.
+    transaction.on_commit(reset_cookable_index)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_authors(update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login - это не повод
+    # сбрасывать кэш рецептов.
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        bump_version_on_commit('recipes')
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_user_relations(instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_relations(user_id))
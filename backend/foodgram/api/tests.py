@@ -0,0 +1,259 @@
+import base64
+import io
+
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.metrics import uninstrument_serializers
+from api.mixins import is_unique_violation
+from api.serializers import Base64ImageField
+from recipes.models import (FavoriteRecipe, Follow, Ingredient,
+                            IngredientsAmount, Recipe, ShoppingCart, Tag)
+from users.models import User
+
+
+class RecipeAPITestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            User.objects.create_user(
+                username=f'author{number}', email=f'author{number}@test.ru',
+                password='password', first_name='Имя', last_name='Фамилия')
+            for number in range(3)
+        ]
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@test.ru', password='password',
+            first_name='Имя', last_name='Фамилия')
+        tags = [
+            Tag.objects.create(
+                name=f'Тэг {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(4)
+        ]
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=authors[number % 3], name=f'Рецепт {number}',
+                text='Описание', cooking_time=number + 1)
+            recipe.tags.set(tags[:1 + number % 3])
+            IngredientsAmount.objects.bulk_create(
+                IngredientsAmount(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+                for ingredient in ingredients[:1 + number % 4]
+            )
+            if number % 2:
+                FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+        cls.recipe = Recipe.objects.first()
+
+    def setUp(self):
+        # Анонимные ответы кэшируются, без очистки повторный запрос
+        # не сделает ни одного SQL-запроса.
+        caches['default'].clear()
+        self.anonymous = APIClient()
+        self.authorized = APIClient()
+        self.authorized.force_authenticate(self.user)
+
+
+class RecipeQueryCountTest(RecipeAPITestCase):
+
+    def assertQueries(self, client, url, expected):
+        caches['default'].clear()
+        with self.assertNumQueries(expected):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        # Подсчёт, рецепты, тэги, ингредиенты; авторизованному ещё
+        # избранное, корзина и подписки.
+        cases = ((self.anonymous, 4), (self.authorized, 7))
+        for fast in (True, False):
+            for client, expected in cases:
+                for page_size in (2, 10):
+                    with self.subTest(fast=fast, page_size=page_size,
+                                      expected=expected), self.settings(
+                            API_FAST_SERIALIZERS=fast):
+                        self.assertQueries(
+                            client, f'/api/recipes/?page_size={page_size}',
+                            expected)
+
+    def test_retrieve_query_count(self):
+        # Рецепт, тэги, ингредиенты, похожие рецепты, пищевая ценность;
+        # авторизованному ещё избранное, корзина и подписки.
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertQueries(self.anonymous, url, 5)
+        self.assertQueries(self.authorized, url, 8)
+
+    def test_relation_delete_query_count(self):
+        # SELECT удаляемых строк, DELETE и работа сигналов:
+        # счётчик избранного, пересборка списка покупок, лента подписок.
+        favorite = FavoriteRecipe.objects.filter(user=self.user).first()
+        cart = ShoppingCart.objects.filter(user=self.user).first()
+        follow = Follow.objects.get(user=self.user)
+        for url, expected in (
+                (f'/api/recipes/{favorite.recipe_id}/favorite/', 3),
+                (f'/api/recipes/{cart.recipe_id}/shopping_cart/', 9),
+                (f'/api/users/{follow.author_id}/subscribe/', 4)):
+            with self.subTest(url=url), self.assertNumQueries(expected):
+                response = self.authorized.delete(url)
+            self.assertEqual(response.status_code, 204)
+
+
+class MetricsTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(uninstrument_serializers)
+
+    def test_fast_list_serializer_time_is_measured(self):
+        with self.settings(API_METRICS_ENABLED=True,
+                           API_FAST_SERIALIZERS=True):
+            response = APIClient().get('/api/recipes/')
+        timing = dict(
+            part.split(';')[:2]
+            for part in response['Server-Timing'].split(', '))
+        self.assertGreater(float(timing['serializer'][len('dur='):]), 0)
+
+
+class ApproximateCountTest(RecipeAPITestCase):
+    def test_list_backed_endpoints(self):
+        ingredient_ids = ','.join(
+            str(pk) for pk in Ingredient.objects.values_list('id', flat=True))
+        for url in ('/api/recipes/feed/',
+                    f'/api/recipes/cookable/?ingredients={ingredient_ids}'):
+            with self.subTest(url=url):
+                separator = '&' if '?' in url else '?'
+                response = self.authorized.get(
+                    f'{url}{separator}approximate_count=1&page_size=2')
+                self.assertEqual(response.status_code, 200)
+                self.assertGreater(response.json()['count'], 2)
+                self.assertIsNotNone(response.json()['next'])
+
+
+class ShoppingListDownloadTest(RecipeAPITestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def test_errors_are_plain_text(self):
+        for client, query, status, message in (
+                (self.anonymous, '', 401,
+                 'Учетные данные не были предоставлены.'),
+                (self.authorized, '?format=json', 404,
+                 'Страница не найдена.')):
+            with self.subTest(status=status):
+                response = client.get(self.url + query)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response.content.decode(), message)
+
+    def test_empty_cart_message(self):
+        ShoppingCart.objects.filter(user=self.user).delete()
+        response = self.authorized.get(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content.decode(), 'Список покупок пуст.')
+
+
+class IngredientListTest(RecipeAPITestCase):
+    def test_fields(self):
+        for fast in (True, False):
+            with self.subTest(fast=fast), self.settings(
+                    API_FAST_SERIALIZERS=fast):
+                caches['default'].clear()
+                ingredient = self.anonymous.get('/api/ingredients/').json()[0]
+                self.assertEqual(
+                    set(ingredient), {'id', 'name', 'measurement_unit'})
+
+
+class RecipeCacheTest(RecipeAPITestCase):
+    def test_popular_ordering_follows_new_favorites(self):
+        url = '/api/recipes/?ordering=popular&page_size=1'
+        self.anonymous.get(url)
+        recipe = Recipe.objects.filter(favorites_count=0).last()
+        for user in User.objects.exclude(pk=self.user.pk):
+            FavoriteRecipe.objects.create(user=user, recipe=recipe)
+        response = self.anonymous.get(url)
+        self.assertEqual(response.json()['results'][0]['id'], recipe.id)
+
+
+class RecipeCursorPaginationTest(RecipeAPITestCase):
+    def get_ids(self, url):
+        ids = []
+        while url:
+            response = self.anonymous.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids.extend(recipe['id'] for recipe in data['results'])
+            url = data['next']
+        return ids
+
+    def test_cursor_follows_active_ordering(self):
+        for ordering in ('newest', 'popular', 'cooking_time'):
+            with self.subTest(ordering=ordering):
+                self.assertEqual(
+                    self.get_ids(
+                        f'/api/recipes/?ordering={ordering}'
+                        '&pagination=cursor&page_size=5'),
+                    self.get_ids(
+                        f'/api/recipes/?ordering={ordering}&page_size=20'))
+
+    def test_cursor_rejected_for_unsupported_ordering(self):
+        for query in ('ordering=calories', 'ordering=price', 'search=рецепт'):
+            with self.subTest(query=query):
+                response = self.anonymous.get(
+                    f'/api/recipes/?{query}&pagination=cursor')
+                self.assertEqual(response.status_code, 400)
+
+
+class UniqueCreateTest(RecipeAPITestCase):
+    def get_integrity_error(self, **kwargs):
+        with self.assertRaises(IntegrityError) as context:
+            with transaction.atomic():
+                FavoriteRecipe.objects.create(**kwargs)
+        return context.exception
+
+    def test_repeated_relation_error_payload(self):
+        favorite = FavoriteRecipe.objects.filter(user=self.user).first()
+        cart = ShoppingCart.objects.filter(user=self.user).first()
+        follow = Follow.objects.get(user=self.user)
+        for url, payload in (
+                (f'/api/recipes/{favorite.recipe_id}/favorite/',
+                 {'favorite_recipe_error': ['Рецепт уже в избранном']}),
+                (f'/api/recipes/{cart.recipe_id}/shopping_cart/',
+                 {'errors': ['Рецепт уже добавлен в список покупок']}),
+                (f'/api/users/{follow.author_id}/subscribe/',
+                 {'non_field_errors': [
+                     'Вы уже подписаны на данного пользователя']})):
+            with self.subTest(url=url):
+                response = self.authorized.post(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), payload)
+
+    def test_only_named_constraint_is_unique_violation(self):
+        favorite = FavoriteRecipe.objects.filter(user=self.user).first()
+        duplicate = self.get_integrity_error(
+            user=self.user, recipe_id=favorite.recipe_id)
+        not_null = self.get_integrity_error(user=self.user, recipe=None)
+        self.assertTrue(is_unique_violation(
+            duplicate, FavoriteRecipe, 'unique_favorite_recipe'))
+        self.assertFalse(is_unique_violation(
+            duplicate, ShoppingCart, 'unique_recipe_shopping_cart'))
+        self.assertFalse(is_unique_violation(
+            not_null, FavoriteRecipe, 'unique_favorite_recipe'))
+
+
+class Base64ImageFieldTest(SimpleTestCase):
+    def test_mime_wrapped_base64_is_decoded(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(buffer, 'PNG')
+        content = buffer.getvalue()
+        field = Base64ImageField()
+        field.chunk_size = 50
+        data = 'data:image/png;base64,' + base64.encodebytes(
+            content).decode().replace('\n', '\r\n')
+        file = field.decode(data)
+        self.assertEqual(file.read(), content)
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import (CustomUserViewSet, FavoriteRecipeViewSet, FollowViewSet,
-                    IngredientViewSet, RecipeViewSet, ShoppingCartViewSet,
+from .async_views import get_urlpatterns as get_async_urlpatterns
+from .views import (CustomUserViewSet, DatabaseMetricsView,
+                    FavoriteRecipeViewSet, FollowViewSet, IngredientViewSet,
+                    MetricsView, RecipeViewSet, ShoppingCartViewSet,
                     TagViewSet)
 
 app_name = 'api'
@@ -23,7 +26,11 @@ router.register(
     basename='shoppingcart')
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('metrics/db/', DatabaseMetricsView.as_view(), name='metrics-db'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
-]
\ No newline at end of file
+]
+if settings.API_ASYNC_VIEWS:
+    urlpatterns = get_async_urlpatterns(router) + urlpatterns
@@ -1,70 +1,219 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import BooleanField, Value
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from foodgram.db.pool import get_pool_stats
 from recipes.models import (FavoriteRecipe, Follow, Ingredient,
-                            IngredientsAmount, Recipe, ShoppingCart, Tag)
+                            IngredientsAmount, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
 from users.models import User
 
-from .filters import IngredientsFilter, RecipesFilter
-from .mixins import BaseClassViewSets, CreateDestroyViewSet
+from .cookable import cookable_index, get_missing
+from .fast_serializers import FastIngredientSerializer, FastRecipeSerializer
+from .feed import get_feed
+from .filters import RECIPE_ORDERINGS, IngredientsFilter, RecipesFilter
+from .metrics import registry
+from .mixins import (BaseClassViewSets, CachedReadOnlyMixin,
+                     CreateDestroyViewSet, FastListMixin, UniqueCreateMixin)
 from .permissions import IsOwnerOrReadOnly
+from .relations import invalidate_relations
+from .renderers import (CSVShoppingListRenderer, PDFShoppingListRenderer,
+                        TextShoppingListRenderer)
 from .serializers import (AllUserSerializer, ChangePasswordSerializer,
-                          FavoriteRecipeSerializer, FollowSerializer,
-                          IngredientSerializer, NewUserCreateSerializer,
-                          RecipeCreatUpdateSerializer, RecipeGetSerializer,
-                          ShoppingCartSerializer, TagSerializer)
+                          CookableQuerySerializer, FavoriteRecipeSerializer,
+                          FollowSerializer, IngredientSerializer,
+                          NewUserCreateSerializer, RecipeCreatUpdateSerializer,
+                          RecipeDetailSerializer, RecipeGetSerializer,
+                          ShoppingCartBulkSerializer, ShoppingCartSerializer,
+                          ShoppingListItemSerializer, TagSerializer,
+                          get_recipes_limit)
+from .shopping_list import get_shopping_list, get_shopping_list_items
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedReadOnlyMixin, FastListMixin,
+                    viewsets.ModelViewSet):
+    fast_serializer_class = FastRecipeSerializer
+    cache_namespace = 'recipes'
+    cache_timeout = settings.API_RECIPES_CACHE_TIMEOUT
+    cache_control = {'public': True, 'max_age': settings.API_RECIPES_MAX_AGE}
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly)
     filterset_class = RecipesFilter
+    keyset_orderings = {'list': ('-pub_date', '-id')}
+
+    def should_cache(self, request):
+        # Ответ анонимному пользователю одинаков для всех: флаги
+        # избранного, корзины и подписки в нём всегда False. Порядок
+        # popular меняется с каждым добавлением в избранное, которое
+        # версию кэша рецептов не сбрасывает, поэтому он не кэшируется.
+        return (not request.user.is_authenticated
+                and request.query_params.get('ordering') != 'popular'
+                and super().should_cache(request))
+
+    def get_keyset_ordering(self, ordering):
+        # Курсор строится по полям активной сортировки. Сортировки по
+        # выражениям и по релевантности поиска курсор не поддерживают.
+        params = self.request.query_params
+        if params.get('search'):
+            return None
+        ordering = RECIPE_ORDERINGS.get(params.get('ordering'), ordering)
+        if all(isinstance(field, str) for field in ordering):
+            return ordering
+        return None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return queryset.with_related()
+        return queryset
 
     def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return RecipeDetailSerializer
         if self.request.method == "GET":
             return RecipeGetSerializer
         return RecipeCreatUpdateSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(
+        detail=False,
+        methods=('POST', 'DELETE'),
+        permission_classes=(IsAuthenticated,))
+    def shopping_cart(self, request):
+        """Добавляет или убирает из корзины несколько рецептов сразу."""
+        serializer = ShoppingCartBulkSerializer(
+            data=request.data,
+            context={'request': request},
+        )
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        user = request.user
+        if request.method == 'DELETE':
+            ShoppingCart.objects.filter(
+                user=user, recipe_id__in=recipes).delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            ShoppingCart.objects.bulk_create(
+                (ShoppingCart(user=user, recipe_id=recipe_id)
+                 for recipe_id in recipes),
+                ignore_conflicts=True
+            )
+            ShoppingListItem.objects.rebuild(
+                (user.id,),
+                IngredientsAmount.objects.filter(
+                    recipe_id__in=recipes).values('ingredient_id')
+            )
+            transaction.on_commit(lambda: invalidate_relations(user.id))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(
         detail=False,
         methods=('GET',),
         permission_classes=(IsAuthenticated,))
+    def shopping_list(self, request):
+        """Список покупок в JSON, по странице за запрос."""
+        pages = self.paginate_queryset(
+            get_shopping_list_items(request.user))
+        serializer = ShoppingListItemSerializer(pages, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=('GET',))
+    def cookable(self, request):
+        """Рецепты из имеющихся ингредиентов.
+
+        Сначала те, что можно приготовить целиком, затем с одним, двумя и
+        т.д. недостающими ингредиентами.
+        """
+        query = CookableQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        pantry = query.validated_data['ingredients']
+        page = self.paginate_queryset(cookable_index.search(
+            pantry, query.validated_data['max_missing']))
+        recipes = {
+            recipe['id']: recipe
+            for recipe in self.get_recipes_data(
+                [recipe_id for recipe_id, _ in page])
+        }
+        data = [
+            {
+                **recipes[recipe_id],
+                'missing_count': missing,
+                'missing_ingredients': get_missing(
+                    recipes[recipe_id]['ingredients'], pantry),
+            }
+            for recipe_id, missing in page
+            if recipe_id in recipes
+        ]
+        return self.get_paginated_response(data)
+
+    @action(
+        detail=False,
+        methods=('GET',),
+        permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Рецепты авторов из подписок пользователя, новые первыми."""
+        page = self.paginate_queryset(get_feed(request.user))
+        recipes = {
+            recipe['id']: recipe
+            for recipe in self.get_recipes_data(page)
+        }
+        return self.get_paginated_response(
+            [recipes[recipe_id] for recipe_id in page
+             if recipe_id in recipes])
+
+    def get_recipes_data(self, ids):
+        context = self.get_serializer_context()
+        if settings.API_FAST_SERIALIZERS:
+            serializer = FastRecipeSerializer(context=context)
+            return serializer.to_representation(
+                Recipe.objects.filter(pk__in=ids).values(*serializer.lookups))
+        return RecipeGetSerializer(
+            Recipe.objects.with_related().filter(pk__in=ids),
+            many=True,
+            context=context
+        ).data
+
+    @action(
+        detail=False,
+        methods=('GET',),
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(TextShoppingListRenderer, CSVShoppingListRenderer,
+                          PDFShoppingListRenderer))
     def download_shopping_cart(self, request):
         user = request.user
         if not user.shopping_cart.exists():
             return Response(
                 'Список покупок пуст.', status=status.HTTP_400_BAD_REQUEST)
 
-        text = 'Список покупок:\n\n'
-        ingred_name = 'recipe__recipe__ingredient__name'
-        ingred_unit = 'recipe__recipe__ingredient__measurement_unit'
-        ingred_amount = 'recipe__recipe__amount'
-        ingred_sum = 'recipe__recipe__amount__sum'
-        cart = user.shopping_cart.select_related('recipe').values(
-            ingred_name, ingred_unit).annotate(Sum(ingred_amount)
-                                               ).order_by(ingred_name)
-        for item in cart:
-            text += (
-                f'{item[ingred_name]} ({item[ingred_unit]})'
-                f' — {item[ingred_sum]}\n'
-            )
-        response = HttpResponse(text, content_type='text/plain')
-        filename = 'shopping_list.txt'
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(get_shopping_list(user)),
+            content_type=content_type
+        )
+        filename = f'shopping_list.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedReadOnlyMixin, FastListMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    fast_serializer_class = FastIngredientSerializer
+    cache_namespace = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
@@ -72,7 +221,8 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientsFilter
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedReadOnlyMixin, viewsets.ReadOnlyModelViewSet):
+    cache_namespace = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
@@ -82,6 +232,7 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
 class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     permission_classes = (IsAuthenticated,)
+    keyset_orderings = {'subscriptions': ('-created', '-id')}
 
     def get_serializer_class(self):
         if self.action == 'set_password':
@@ -103,7 +254,13 @@ class CustomUserViewSet(UserViewSet):
         detail=False,
         permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        queryset = Follow.objects.filter(user=request.user)
+        queryset = Follow.objects.filter(
+            user=request.user
+        ).with_recipes(
+            get_recipes_limit(request)
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('-created')
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
             pages,
@@ -113,7 +270,7 @@ class CustomUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class FollowViewSet(CreateDestroyViewSet):
+class FollowViewSet(UniqueCreateMixin, CreateDestroyViewSet):
     serializer_class = FollowSerializer
 
     def get_queryset(self):
@@ -121,11 +278,12 @@ class FollowViewSet(CreateDestroyViewSet):
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context['author_id'] = self.kwargs.get('user_id')
+        context['author_id'] = int(self.kwargs.get('user_id'))
         return context
 
     def perform_create(self, serializer):
-        serializer.save(
+        self.save_unique(
+            serializer,
             user=self.request.user,
             author=get_object_or_404(
                 User,
@@ -135,15 +293,13 @@ class FollowViewSet(CreateDestroyViewSet):
 
     @action(methods=('DELETE',), detail=True)
     def delete(self, request, user_id):
-        get_object_or_404(User, id=user_id)
-        if not Follow.objects.filter(
-                user=request.user, author_id=user_id).exists():
+        # Сигналы после удаления уменьшают followers_count автора
+        # и убирают его рецепты из ленты подписчика.
+        deleted, _ = Follow.objects.filter(
+            user=request.user, author_id=user_id).delete()
+        if not deleted:
+            get_object_or_404(User, id=user_id)
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        get_object_or_404(
-            Follow,
-            user=request.user,
-            author_id=user_id
-        ).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -173,3 +329,35 @@ class ShoppingCartViewSet(BaseClassViewSets):
     @action(methods=('DELETE',), detail=True)
     def delete(self, request, recipe_id):
         return self.destroy(request, recipe_id, ShoppingCart)
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(registry.snapshot())
+
+    def delete(self, request):
+        registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class DatabaseMetricsView(APIView):
+    """Настройки соединений и заполненность пулов текущего процесса."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({
+            'databases': {
+                connection.alias: {
+                    'vendor': connection.vendor,
+                    'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                    'health_checks': bool(connection.settings_dict.get(
+                        'CONN_HEALTH_CHECKS')),
+                    'pool': bool(connection.settings_dict.get('POOL')),
+                }
+                for connection in connections.all()
+            },
+            'pools': get_pool_stats(),
+        })
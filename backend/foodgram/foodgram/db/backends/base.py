@@ -0,0 +1,78 @@
+from functools import partial
+
+from ..pool import get_pool
+
+
+class PooledDatabaseWrapperMixin:
+    """Проверка постоянных соединений и пул соединений процесса.
+
+    ``CONN_HEALTH_CHECKS`` - перед первым запросом к БД в каждом
+    HTTP-запросе постоянное соединение проверяется и при обрыве
+    открывается заново, как в Django 4.1. ``POOL`` - соединения берутся
+    из пула процесса и возвращаются в него вместо закрытия; вместе с
+    пулом используется ``CONN_MAX_AGE = 0``.
+    """
+
+    health_check_done = False
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return None
+        return get_pool(self.alias, options)
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        return pool.acquire(
+            partial(super().get_new_connection, conn_params),
+            self.check_connection)
+
+    def check_connection(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except self.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        connection = self.connection
+        # Внутри atomic обёртка хранит ссылку на соединение до конца
+        # блока, отдавать его другим потокам нельзя - оно закрывается.
+        reusable = not self.in_atomic_block
+        if reusable:
+            try:
+                connection.rollback()
+            except self.Database.Error:
+                reusable = False
+            else:
+                reusable = (not self.errors_occurred
+                            or self.check_connection(connection))
+        pool.release(connection, reusable)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None
+                and not self.health_check_done
+                and not self.in_atomic_block
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
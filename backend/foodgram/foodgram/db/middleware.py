@@ -0,0 +1,47 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+from .routers import use_replica
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_KEY = 'db:primary:{}'
+
+
+def get_pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return PIN_KEY.format(
+        hashlib.sha256(authorization.encode()).hexdigest())
+
+
+class ReplicaMiddleware:
+    """Направляет чтение безопасных запросов к API на реплики.
+
+    После записи клиент с тем же заголовком Authorization ещё
+    DATABASE_REPLICA_PIN_SECONDS секунд читает из default и видит
+    собственные изменения, даже если реплика отстаёт.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pin_key = get_pin_key(request)
+        safe = request.method in SAFE_METHODS
+        token = use_replica.set(
+            safe
+            and request.path.startswith(settings.DATABASE_REPLICA_PREFIX)
+            and not (pin_key and cache.get(pin_key)))
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        if pin_key and not safe and settings.DATABASE_REPLICA_PIN_SECONDS:
+            cache.set(pin_key, True, settings.DATABASE_REPLICA_PIN_SECONDS)
+        return response
@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+REUSE, CHECK, DISCARD, CREATE = 'reuse', 'check', 'discard', 'create'
+
+
+class PoolTimeout(OperationalError):
+    """Все соединения пула заняты дольше допустимого ожидания."""
+
+
+class ConnectionPool:
+    """Пул соединений DB-API внутри процесса.
+
+    Соединения открываются по требованию до ``max_size``, при исчерпании
+    пула запрос ждёт освобождения до ``timeout`` секунд. Соединение
+    старше ``max_lifetime`` закрывается при возврате, пролежавшее без дела
+    дольше ``check_interval`` проверяется перед выдачей.
+    """
+
+    def __init__(self, max_size=10, timeout=10, max_lifetime=None,
+                 check_interval=30):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # (соединение, время создания, время возврата), последним
+        # выдаётся последнее возвращённое: оно точно живо.
+        self._idle = deque()
+        self._created_at = {}
+        self._size = 0
+        self._waiting = 0
+        self._stats = {
+            'requests': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time': 0.0,
+            'max_wait_time': 0.0,
+            'max_in_use': 0,
+            'created': 0,
+            'discarded': 0,
+        }
+
+    @property
+    def in_use(self):
+        return self._size - len(self._idle)
+
+    def expired(self, created_at, now):
+        return (self.max_lifetime is not None
+                and now - created_at >= self.max_lifetime)
+
+    def acquire(self, connect, check):
+        """Выдаёт соединение из пула или открывает новое через ``connect``.
+
+        ``check(connection)`` проверяет соединение, долго лежавшее в пуле;
+        неработающее закрывается и не выдаётся.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._condition:
+            self._stats['requests'] += 1
+        while True:
+            action, connection, took_wait = self._take(deadline)
+            waited = waited or took_wait
+            if action == DISCARD or (
+                    action == CHECK and not check(connection)):
+                self._discard(connection)
+                continue
+            if action == CREATE:
+                connection = self._create(connect)
+            break
+        self._record_wait(started, waited)
+        return connection
+
+    def _take(self, deadline):
+        """Свободное соединение или право открыть новое.
+
+        Возвращает ``(action, connection, waited)``, где action - REUSE,
+        CHECK (соединение нужно проверить), DISCARD (закрыть и взять
+        следующее) или CREATE (место под новое соединение уже занято).
+        """
+        waited = False
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, created_at, released_at = self._idle.pop()
+                    now = time.monotonic()
+                    if self.expired(created_at, now):
+                        return DISCARD, connection, waited
+                    self._update_max_in_use()
+                    if now - released_at >= self.check_interval:
+                        return CHECK, connection, waited
+                    return REUSE, connection, waited
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._update_max_in_use()
+                    return CREATE, None, waited
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'Пул соединений исчерпан: {self.max_size} '
+                        f'соединений заняты дольше {self.timeout} с.')
+                waited = True
+                self._waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _create(self, connect):
+        try:
+            connection = connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._created_at[connection] = time.monotonic()
+            self._stats['created'] += 1
+        return connection
+
+    def release(self, connection, reusable=True):
+        now = time.monotonic()
+        with self._condition:
+            created_at = self._created_at.get(connection)
+            if created_at is None:
+                return
+            if reusable and not self.expired(created_at, now):
+                self._idle.append((connection, created_at, now))
+                self._condition.notify()
+                return
+        self._discard(connection)
+
+    def _discard(self, connection):
+        with self._condition:
+            if self._created_at.pop(connection, None) is None:
+                return
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _update_max_in_use(self):
+        self._stats['max_in_use'] = max(
+            self._stats['max_in_use'], self.in_use)
+
+    def _record_wait(self, started, waited):
+        if not waited:
+            return
+        wait_time = time.monotonic() - started
+        with self._condition:
+            self._stats['waits'] += 1
+            self._stats['wait_time'] += wait_time
+            self._stats['max_wait_time'] = max(
+                self._stats['max_wait_time'], wait_time)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            in_use = self.in_use
+            stats.update(
+                size=self._size,
+                in_use=in_use,
+                idle=len(self._idle),
+                waiting=self._waiting,
+                max_size=self.max_size,
+                saturation=round(in_use / self.max_size, 3),
+            )
+        stats['wait_time_ms'] = round(stats.pop('wait_time') * 1000, 3)
+        stats['max_wait_time_ms'] = round(
+            stats.pop('max_wait_time') * 1000, 3)
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options):
+    """Пул для псевдонима БД; после fork процесс создаёт свой пул."""
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[alias] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 10),
+                max_lifetime=options.get('MAX_LIFETIME'),
+                check_interval=options.get('CHECK_INTERVAL', 30),
+            )
+        return pool
+
+
+def get_pool_stats():
+    with _pools_lock:
+        pools = {
+            alias: pool for alias, pool in _pools.items()
+            if pool.pid == os.getpid()
+        }
+    return {alias: pool.stats() for alias, pool in sorted(pools.items())}
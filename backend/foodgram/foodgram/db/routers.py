@@ -0,0 +1,41 @@
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+use_replica = contextvars.ContextVar('db_use_replica', default=False)
+
+
+class ReplicaRouter:
+    """Чтение в безопасных запросах к API - с реплик, запись - в default.
+
+    Реплики включает ReplicaMiddleware через ``use_replica``. После
+    первой записи, внутри транзакций и для моделей ``primary_apps``
+    чтение идёт из default, чтобы не видеть отставание реплики.
+    """
+
+    primary_apps = {'authtoken'}
+
+    def db_for_read(self, model, **hints):
+        if (not use_replica.get()
+                or not settings.DATABASE_REPLICAS
+                or model._meta.app_label in self.primary_apps
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        use_replica.set(False)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,164 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from recipes.models import Recipe
+
+from .middleware import ReplicaMiddleware
+from .pool import ConnectionPool, PoolTimeout
+from .routers import ReplicaRouter, use_replica
+
+REPLICAS = ['replica_0']
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.token = use_replica.set(True)
+
+    def tearDown(self):
+        use_replica.reset(self.token)
+
+    def test_reads_go_to_replica_writes_to_default(self):
+        self.assertIn(self.router.db_for_read(Recipe), REPLICAS)
+        self.assertEqual(self.router.db_for_write(Recipe), DEFAULT_DB_ALIAS)
+
+    def test_reads_stay_on_default_after_write(self):
+        self.router.db_for_write(Recipe)
+        self.assertEqual(self.router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+
+    def test_reads_inside_atomic_go_to_default(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        connection.in_atomic_block = True
+        try:
+            self.assertEqual(
+                self.router.db_for_read(Recipe), DEFAULT_DB_ALIAS)
+        finally:
+            connection.in_atomic_block = False
+
+    def test_no_migrations_on_replicas(self):
+        self.assertIs(
+            self.router.allow_migrate(REPLICAS[0], 'recipes'), False)
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS, DATABASE_REPLICA_PIN_SECONDS=5)
+class ReplicaMiddlewareTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory(HTTP_AUTHORIZATION='Token secret')
+        self.seen = []
+
+    def get_response(self, request):
+        self.seen.append(use_replica.get())
+        if request.method == 'POST':
+            ReplicaRouter().db_for_write(Recipe)
+        return None
+
+    def test_client_reads_primary_after_write(self):
+        middleware = ReplicaMiddleware(self.get_response)
+        middleware(self.factory.get('/api/recipes/'))
+        middleware(self.factory.post('/api/recipes/'))
+        middleware(self.factory.get('/api/recipes/'))
+        middleware(RequestFactory().get('/api/recipes/'))
+        self.assertEqual(self.seen, [True, False, False, True])
+        self.assertFalse(use_replica.get())
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def test_released_connection_is_reused(self):
+        pool = ConnectionPool(max_size=2)
+        connection = pool.acquire(FakeConnection, lambda connection: True)
+        pool.release(connection)
+        self.assertIs(
+            pool.acquire(FakeConnection, lambda connection: True), connection)
+        self.assertEqual(pool.stats()['created'], 1)
+
+    def test_idle_connection_is_checked(self):
+        pool = ConnectionPool(max_size=1, check_interval=0)
+        broken = pool.acquire(FakeConnection, lambda connection: True)
+        pool.release(broken)
+        connection = pool.acquire(FakeConnection, lambda connection: False)
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_expired_and_unusable_connections_are_discarded(self):
+        pool = ConnectionPool(max_size=2, max_lifetime=0)
+        expired = pool.acquire(FakeConnection, lambda connection: True)
+        pool.release(expired)
+        self.assertTrue(expired.closed)
+        pool = ConnectionPool(max_size=2)
+        unusable = pool.acquire(FakeConnection, lambda connection: True)
+        pool.release(unusable, reusable=False)
+        self.assertTrue(unusable.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_exhausted_pool_times_out(self):
+        pool = ConnectionPool(max_size=1, timeout=0.01)
+        pool.acquire(FakeConnection, lambda connection: True)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection, lambda connection: True)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+
+class PooledBackendTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {
+            **connections[DEFAULT_DB_ALIAS].settings_dict,
+            'NAME': os.path.join(directory.name, 'pool.sqlite3'),
+            'CONN_HEALTH_CHECKS': True,
+            'POOL': {'MAX_SIZE': 1, 'CHECK_INTERVAL': 0},
+        }
+        wrapper_class = type(connections[DEFAULT_DB_ALIAS])
+        # Пулы живут в процессе по псевдониму, у каждого теста свой.
+        self.connection = wrapper_class(settings_dict, alias=self.id())
+        self.addCleanup(self.connection.close)
+
+    def test_connection_returns_to_pool(self):
+        self.connection.ensure_connection()
+        raw = self.connection.connection
+        self.connection.close()
+        self.assertEqual(self.connection.pool.stats()['idle'], 1)
+        self.connection.ensure_connection()
+        self.assertIs(self.connection.connection, raw)
+
+    def test_broken_connection_is_replaced(self):
+        self.connection.ensure_connection()
+        raw = self.connection.connection
+        self.connection.close()
+        raw.close()
+        self.connection.ensure_connection()
+        self.assertIsNot(self.connection.connection, raw)
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+
+    def test_health_check_once_per_request(self):
+        # is_usable у SQLite всегда True, поэтому обрыв имитируется.
+        settings_dict = {**self.connection.settings_dict, 'POOL': None}
+        connection = type(self.connection)(settings_dict, alias='health')
+        self.addCleanup(connection.close)
+        connection.ensure_connection()
+        raw = connection.connection
+        connection.close_if_unusable_or_obsolete()
+        with mock.patch.object(
+                connection, 'is_usable', return_value=False) as is_usable:
+            connection.ensure_connection()
+            connection.ensure_connection()
+        self.assertEqual(is_usable.call_count, 1)
+        self.assertIsNot(connection.connection, raw)
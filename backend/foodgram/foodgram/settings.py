@@ -40,6 +40,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.QueryMetricsMiddleware',
+    'foodgram.db.middleware.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -62,17 +64,77 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.postgresql')
+# Обёртки стандартных бэкендов с проверкой соединений и пулом.
+DB_BACKENDS = {
+    'django.db.backends.postgresql': 'foodgram.db.backends.postgresql',
+    'django.db.backends.sqlite3': 'foodgram.db.backends.sqlite3',
+}
+# Пул соединений процесса; соединения возвращаются в него в конце запроса.
+DB_POOL = os.getenv('DB_POOL') == 'True'
+
+DATABASE = {
+    'ENGINE': DB_BACKENDS.get(DB_ENGINE, DB_ENGINE),
+    'NAME': os.getenv('DB_NAME'),
+    'USER': os.getenv('POSTGRES_USER'),
+    'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
+    'HOST': os.getenv('DB_HOST'),
+    'PORT': os.getenv('DB_PORT'),
+    'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', 60)),
+    'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+    'POOL': {
+        'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'MAX_LIFETIME': int(os.getenv('DB_POOL_MAX_LIFETIME', 30 * 60)),
+        'CHECK_INTERVAL': int(os.getenv('DB_POOL_CHECK_INTERVAL', 30)),
+    } if DB_POOL else None,
+}
+
+# Реплики для чтения через запятую: хосты Postgres или файлы SQLite.
+DB_REPLICAS = [
+    replica for replica in os.getenv('DB_REPLICAS', '').split(',') if replica
+]
+DATABASE_REPLICAS = [f'replica_{index}' for index in range(len(DB_REPLICAS))]
+DATABASE_REPLICA_PREFIX = '/api/'
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.getenv('DB_REPLICA_PIN_SECONDS', 5))
+
 DATABASES = {
+    'default': DATABASE,
+    **{
+        alias: {
+            **DATABASE,
+            'NAME' if 'sqlite3' in DB_ENGINE else 'HOST': replica,
+            'TEST': {'MIRROR': 'default'},
+        }
+        for alias, replica in zip(DATABASE_REPLICAS, DB_REPLICAS)
+    },
+}
+DATABASE_ROUTERS = ['foodgram.db.routers.ReplicaRouter']
+
+CACHES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE','django.db.backends.postgresql'),
-        'NAME': os.getenv('DB_NAME'),
-        'USER': os.getenv('POSTGRES_USER'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
-        'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
     }
 }
 
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 60 * 60))
+# 0 - множества связей пользователя кэшируются только в пределах запроса.
+# Между запросами их можно кэшировать только в общем для всех процессов
+# кэше (Redis, Memcached): LocMemCache сбрасывается лишь в процессе,
+# обработавшем запись, и остальные отдавали бы устаревшие флаги.
+API_RELATIONS_CACHE_TIMEOUT = int(
+    os.getenv('API_RELATIONS_CACHE_TIMEOUT', 0))
+# Ответы анонимным пользователям на чтение рецептов: время жизни в кэше
+# приложения и max-age для nginx и браузеров.
+API_RECIPES_CACHE_TIMEOUT = int(os.getenv('API_RECIPES_CACHE_TIMEOUT', 60))
+API_RECIPES_MAX_AGE = int(os.getenv('API_RECIPES_MAX_AGE', 30))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -115,6 +177,38 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 ** 2))
+RECIPE_IMAGE_MAX_DIMENSION = int(os.getenv('RECIPE_IMAGE_MAX_DIMENSION', 6000))
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': ((320, 320), 'JPEG'),
+    'webp': ((960, 960), 'WEBP'),
+}
+
+API_METRICS_ENABLED = os.getenv('API_METRICS_ENABLED') == 'True'
+# Запись о каждом запросе в лог api.metrics, по умолчанию только заголовок
+# Server-Timing и /api/metrics/.
+API_METRICS_LOG = os.getenv('API_METRICS_LOG') == 'True'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+BACKGROUND_TASK_WORKERS = int(os.getenv('BACKGROUND_TASK_WORKERS', 2))
+BACKGROUND_TASKS_EAGER = os.getenv('BACKGROUND_TASKS_EAGER') == 'True'
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -126,10 +220,56 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
     'PAGE_SIZE': 6,
 }
 
+# Списки рецептов и ингредиентов через values() без ModelSerializer
+# и кодировщик JSON: orjson (если установлен) или json.
+API_FAST_SERIALIZERS = os.getenv('API_FAST_SERIALIZERS', 'True') == 'True'
+API_JSON_BACKEND = os.getenv('API_JSON_BACKEND', 'orjson')
+# Асинхронные обработчики чтения, включаются при запуске через asgi.py.
+API_ASYNC_VIEWS = os.getenv('API_ASYNC_VIEWS') == 'True'
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+# Конфигурация полнотекстового поиска PostgreSQL; после её смены нужен
+# manage.py rebuild_search_index.
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+RECIPE_SEARCH_MAX_TERMS = 8
+
+SHOPPING_LIST_CHUNK_SIZE = 2000
+SHOPPING_CART_BULK_LIMIT = 100
+# Подбор рецептов по имеющимся ингредиентам.
+COOKABLE_DEFAULT_MAX_MISSING = 2
+COOKABLE_MAX_MISSING = 5
+COOKABLE_MAX_INGREDIENTS = 200
+# Журнал изменённых рецептов для индексов процессов: длиннее
+# COOKABLE_MAX_CHANGES записей индекс проще построить заново.
+COOKABLE_MAX_CHANGES = 1000
+COOKABLE_CHANGES_TIMEOUT = 60 * 60
+# Лента подписок. Рецепты авторов, у которых подписчиков больше
+# FEED_FANOUT_MAX_FOLLOWERS, не раскладываются по лентам при публикации,
+# а подмешиваются при чтении из кэшируемых списков последних рецептов.
+FEED_TIMELINE_LENGTH = int(os.getenv('FEED_TIMELINE_LENGTH', 500))
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 10000))
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_AUTHOR_RECIPES_TIMEOUT = 60 * 60
+# Похожие рецепты, пересчитываются manage.py build_similar_recipes.
+SIMILAR_RECIPES_TOP_K = 10
+SIMILAR_RECIPES_MIN_SUPPORT = 2
+SIMILAR_RECIPES_MAX_USER_ITEMS = 1000
+# Пар рецептов в одном блоке расчёта, от этого зависит пиковая память.
+SIMILAR_RECIPES_BLOCK_PAIRS = 1024 * 1024
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 DJOSER = {
     'HIDE_USERS': False,
     'LOGIN_FIELD': 'email',
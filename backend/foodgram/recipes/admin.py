@@ -1,7 +1,12 @@
 from django.contrib import admin
 
 from .models import (FavoriteRecipe, Follow, Ingredient, IngredientsAmount,
-                     Recipe, ShoppingCart, Tag)
+                     Recipe, ShoppingCart, ShoppingListItem, Tag)
+
+
+def get_amounts(recipe):
+    return dict(IngredientsAmount.objects.filter(
+        recipe=recipe).values_list('ingredient_id', 'amount'))
 
 
 class IngredientsAmountAdmin(admin.TabularInline):
@@ -15,12 +20,31 @@ class RecipeAdmin(admin.ModelAdmin, ):
         'id', 'name', 'author', 'text', 'pub_date', 'get_fav_amount'
     )
     list_filter = ('name', 'author', 'tags', 'pub_date')
+    list_select_related = ('author',)
+
+    def save_related(self, request, form, formsets, change):
+        # Инлайн сохраняет ингредиенты мимо сериализатора, поэтому списки
+        # покупок с этим рецептом пересчитываются здесь.
+        recipe = form.instance
+        before = get_amounts(recipe)
+        super().save_related(request, form, formsets, change)
+        after = get_amounts(recipe)
+        affected = {
+            ingredient_id for ingredient_id in before.keys() | after.keys()
+            if before.get(ingredient_id) != after.get(ingredient_id)
+        }
+        if affected:
+            ShoppingListItem.objects.rebuild(
+                ShoppingCart.objects.filter(
+                    recipe=recipe).values_list('user_id', flat=True),
+                affected
+            )
 
     def get_fav_amount(self, obj):
-        amount = FavoriteRecipe.objects.filter(recipe=obj).count()
-        return amount
+        return obj.favorites_count
 
     get_fav_amount.short_description = "Кол-во добавлений в изб."
+    get_fav_amount.admin_order_field = 'favorites_count'
 
 
 @admin.register(Ingredient)
@@ -63,3 +87,12 @@ class ShoppingCartAdmin(admin.ModelAdmin):
         'id', 'user', 'recipe'
     )
     list_filter = ('user', 'recipe')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'user', 'ingredient', 'amount'
+    )
+    list_filter = ('user',)
+    list_select_related = ('user', 'ingredient')
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from .search import create_search_vector
+        from .signals import (create_trigram_indexes,
+                              merge_duplicate_ingredients)
+
+        pre_migrate.connect(merge_duplicate_ingredients, sender=self)
+        post_migrate.connect(create_trigram_indexes, sender=self)
+        post_migrate.connect(create_search_vector, sender=self)
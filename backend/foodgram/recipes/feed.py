@@ -0,0 +1,26 @@
+from django.conf import settings
+
+from .models import Follow, TimelineEntry, fanout_recipes
+
+
+def fan_out_recipe(recipe_id):
+    """Раскладывает новый рецепт по лентам подписчиков автора.
+
+    Подписчики читаются пачками по FEED_FANOUT_BATCH_SIZE. Рецепты
+    авторов, у которых подписчиков больше FEED_FANOUT_MAX_FOLLOWERS, не
+    раскладываются: они подмешиваются в ленту при чтении.
+    """
+    recipe = fanout_recipes().filter(pk=recipe_id).values_list(
+        'pk', 'author_id', 'pub_date').first()
+    if recipe is None:
+        return
+    followers = Follow.objects.filter(author_id=recipe[1]).order_by(
+        'user_id').values_list('user_id', flat=True)
+    last_user_id = 0
+    while True:
+        user_ids = list(followers.filter(
+            user_id__gt=last_user_id)[:settings.FEED_FANOUT_BATCH_SIZE])
+        if not user_ids:
+            return
+        TimelineEntry.objects.add((recipe,), user_ids)
+        last_user_id = user_ids[-1]
@@ -0,0 +1,102 @@
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+
+VARIANTS_DIR = 'variants'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла - хэш его содержимого.
+
+    Имя считается при каждом сохранении, какое бы имя ни прислал клиент,
+    поэтому повторная загрузка того же изображения не создаёт новый файл,
+    а разные изображения с одинаковым именем не подменяют друг друга.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        extension = os.path.splitext(name)[1].lower()
+        name = os.path.join(
+            os.path.dirname(name), f'{digest.hexdigest()}{extension}')
+        return self.save_derived(name, content)
+
+    def save_derived(self, name, content):
+        """Сохраняет файл, производный от хэшированного, под его именем."""
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+image_storage = ContentAddressedStorage()
+
+
+def get_variant_name(name, variant):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    image_format = settings.RECIPE_IMAGE_VARIANTS[variant][1]
+    return os.path.join(
+        directory, VARIANTS_DIR, f'{stem}_{variant}.{image_format.lower()}')
+
+
+def get_variant_names(name):
+    return [get_variant_name(name, variant)
+            for variant in settings.RECIPE_IMAGE_VARIANTS]
+
+
+def generate_variants(name):
+    """Создаёт уменьшенные копии изображения рецепта.
+
+    Возвращает имена всех копий по RECIPE_IMAGE_VARIANTS, включая
+    созданные раньше. Изображение декодируется, только если какой-то
+    копии ещё нет.
+    """
+    missing = [
+        (variant_name, size, image_format)
+        for variant_name, (size, image_format) in zip(
+            get_variant_names(name), settings.RECIPE_IMAGE_VARIANTS.values())
+        if not image_storage.exists(variant_name)
+    ]
+    if not missing:
+        return get_variant_names(name)
+    with image_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    for variant_name, size, image_format in missing:
+        resized = image.copy()
+        resized.thumbnail(size)
+        if image_format == 'JPEG':
+            resized = resized.convert('RGB')
+        buffer = io.BytesIO()
+        resized.save(buffer, image_format)
+        image_storage.save_derived(
+            variant_name, ContentFile(buffer.getvalue()))
+    return get_variant_names(name)
+
+
+def get_variant_urls(name, ready):
+    """Ссылки на готовые копии изображения, None - если копии ещё нет.
+
+    ``ready`` - имена копий, записанные при их создании, хранилище
+    при чтении не опрашивается.
+    """
+    if not name:
+        return None
+    ready = set(ready or ())
+    urls = {}
+    for variant in settings.RECIPE_IMAGE_VARIANTS:
+        variant_name = get_variant_name(name, variant)
+        urls[variant] = (image_storage.url(variant_name)
+                         if variant_name in ready else None)
+    return urls
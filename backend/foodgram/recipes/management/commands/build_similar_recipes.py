@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_version
+from recipes.similarity import (build_similarity, load_all_interactions,
+                                save_similarity)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты по совместным добавлениям в '
+            'избранное и корзину. Рассчитана на запуск по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int,
+                            default=settings.SIMILAR_RECIPES_TOP_K,
+                            help='Похожих рецептов на рецепт.')
+        parser.add_argument('--min-support', type=int,
+                            default=settings.SIMILAR_RECIPES_MIN_SUPPORT,
+                            help='Минимум пользователей, добавивших оба '
+                                 'рецепта.')
+        parser.add_argument('--max-user-items', type=int,
+                            default=settings.SIMILAR_RECIPES_MAX_USER_ITEMS,
+                            help='Пользователи с большим числом рецептов '
+                                 'пропускаются.')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Строк в одной выборке из БД.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Строк в одном INSERT.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        interactions = load_all_interactions(options['chunk_size'])
+        loaded = time.monotonic()
+        recipe_ids, similar_ids, scores = build_similarity(
+            interactions,
+            top_k=options['top_k'],
+            min_support=options['min_support'],
+            max_user_items=options['max_user_items'],
+            block_pairs=settings.SIMILAR_RECIPES_BLOCK_PAIRS,
+        )
+        built = time.monotonic()
+        saved = save_similarity(
+            recipe_ids, similar_ids, scores, options['batch_size'])
+        bump_version('recipes')
+        finished = time.monotonic()
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны: добавлений {len(interactions)}, '
+            f'пар {saved}. Загрузка {loaded - started:.1f} с, расчёт '
+            f'{built - loaded:.1f} с, запись {finished - built:.1f} с.'))
@@ -0,0 +1,186 @@
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from api.cache import bump_version
+from api.cookable import reset_cookable_index
+from recipes.models import (FavoriteRecipe, Follow, Ingredient,
+                            IngredientsAmount, Recipe, ShoppingCart, Tag)
+from users.models import User
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'запеканка', 'каша', 'паста', 'рагу', 'омлет',
+    'домашний', 'быстрый', 'летний', 'острый', 'сырный', 'овощной',
+    'куриный', 'рыбный', 'грибной', 'сладкий', 'бабушкин', 'праздничный',
+)
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетические данные для нагрузочного тестирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=15)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя.')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Рецептов в корзине на пользователя.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Нет ингредиентов, сначала выполните load_ingredients.')
+        if options['min_ingredients'] > options['max_ingredients']:
+            raise CommandError(
+                '--min-ingredients больше --max-ingredients.')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            tag_ids = self.create_tags()
+            user_ids = self.create_users(options['users'])
+            recipe_ids = self.create_recipes(
+                options['recipes'], user_ids, tag_ids, ingredient_ids,
+                options['min_ingredients'], options['max_ingredients'])
+            self.create_relations(
+                user_ids, recipe_ids, options['follows'],
+                options['favorites'], options['cart'])
+        call_command('recount', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_timelines', stdout=self.stdout)
+        call_command('rebuild_nutrition', stdout=self.stdout)
+        call_command('build_similar_recipes', stdout=self.stdout)
+        bump_version('tags', 'ingredients')
+        reset_cookable_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, рецептов: '
+            f'{len(recipe_ids)} за {time.monotonic() - started:.1f} с.'
+        ))
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def new_ids(self, model, start):
+        return list(model.objects.filter(
+            id__gt=start).order_by('id').values_list('id', flat=True))
+
+    def max_id(self, model):
+        return model.objects.aggregate(Max('id'))['id__max'] or 0
+
+    def create_tags(self):
+        if not Tag.objects.exists():
+            self.bulk_create(Tag, [
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            ])
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        start = self.max_id(User)
+        password = make_password('synthetic')
+        self.bulk_create(User, [
+            User(
+                username=f'synthetic{start + i}',
+                email=f'synthetic{start + i}@example.org',
+                first_name='Синтетический',
+                last_name=f'Пользователь {start + i}',
+                password=password,
+            )
+            for i in range(1, count + 1)
+        ])
+        return self.new_ids(User, start)
+
+    def create_recipes(self, count, user_ids, tag_ids, ingredient_ids,
+                       min_ingredients, max_ingredients):
+        start = self.max_id(Recipe)
+        choice = self.random.choice
+        self.bulk_create(Recipe, [
+            Recipe(
+                author_id=choice(user_ids),
+                name=f'{choice(WORDS)} {choice(WORDS)} {i}'.capitalize(),
+                text=' '.join(self.random.choices(WORDS, k=30)),
+                cooking_time=self.random.randint(5, 180),
+            )
+            for i in range(count)
+        ])
+        recipe_ids = self.new_ids(Recipe, start)
+
+        # Популярность ингредиентов убывает по закону Ципфа.
+        weights = list(accumulate(
+            1 / rank for rank in range(1, len(ingredient_ids) + 1)))
+        recipe_tags = []
+        amounts = []
+        for recipe_id in recipe_ids:
+            for tag_id in self.random.sample(
+                    tag_ids, self.random.randint(1, len(tag_ids))):
+                recipe_tags.append(Recipe.tags.through(
+                    recipe_id=recipe_id, tag_id=tag_id))
+            size = min(
+                self.random.randint(min_ingredients, max_ingredients),
+                len(ingredient_ids))
+            chosen = set()
+            while len(chosen) < size:
+                chosen.update(self.random.choices(
+                    ingredient_ids, cum_weights=weights,
+                    k=size - len(chosen)))
+            amounts.extend(
+                IngredientsAmount(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500))
+                for ingredient_id in chosen
+            )
+            if len(amounts) >= self.batch_size:
+                self.bulk_create(Recipe.tags.through, recipe_tags)
+                self.bulk_create(IngredientsAmount, amounts)
+                recipe_tags, amounts = [], []
+        self.bulk_create(Recipe.tags.through, recipe_tags)
+        self.bulk_create(IngredientsAmount, amounts)
+        return recipe_ids
+
+    def create_relations(self, user_ids, recipe_ids, follows, favorites,
+                         cart):
+        follow_rows = []
+        favorite_rows = []
+        cart_rows = []
+        for user_id in user_ids:
+            follow_rows.extend(
+                Follow(user_id=user_id, author_id=author_id)
+                for author_id in self.random.sample(
+                    user_ids, min(follows, len(user_ids)))
+                if author_id != user_id
+            )
+            favorite_rows.extend(
+                FavoriteRecipe(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(
+                    recipe_ids, min(favorites, len(recipe_ids)))
+            )
+            cart_rows.extend(
+                ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(
+                    recipe_ids, min(cart, len(recipe_ids)))
+            )
+        self.bulk_create(Follow, follow_rows)
+        self.bulk_create(FavoriteRecipe, favorite_rows)
+        self.bulk_create(ShoppingCart, cart_rows)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии изображений рецептов '
+            'и запоминает их в рецептах.')
+
+    def handle(self, *args, **options):
+        count = Recipe.objects.generate_image_variants()
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии изображений созданы: изображений {count}.'))
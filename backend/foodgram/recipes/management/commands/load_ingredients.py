@@ -1,22 +1,167 @@
+import csv
 import json
+import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
-from recipes.models import Ingredient
+from api.cache import bump_version
+from recipes.models import Ingredient, RecipeNutrition
+from recipes.nutrition import NUTRITION_FIELDS
 
-FILE_PATH = '/data/ingredients.json'
-DIR_PATH = settings.BASE_DIR
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_json(file):
+    """Построчно разбирает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON.')
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def read_csv(file):
+    """Строки ``название,единица[,калории,белки,жиры,углеводы,цена]``."""
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row[:2]
+            yield {
+                'name': name,
+                'measurement_unit': measurement_unit,
+                **dict(zip(NUTRITION_FIELDS, row[2:])),
+            }
+
+
+def read_nutrition(item):
+    """Пищевая ценность и цена из строки файла, None - нет данных."""
+    if not any(field in item for field in NUTRITION_FIELDS):
+        return None
+    nutrition = {}
+    for field in NUTRITION_FIELDS:
+        value = item.get(field)
+        if isinstance(value, str):
+            value = value.strip().replace(',', '.') or None
+        try:
+            nutrition[field] = None if value is None else float(value)
+        except ValueError:
+            raise CommandError(
+                f'{item["name"]}: некорректное значение {field}: {value}')
+        if nutrition[field] is not None and nutrition[field] < 0:
+            raise CommandError(
+                f'{item["name"]}: отрицательное значение {field}.')
+    return nutrition
+
+
+def make_ingredient(item):
+    ingredient = Ingredient(
+        name=item['name'].strip(),
+        measurement_unit=item['measurement_unit'].strip()
+    )
+    ingredient.nutrition = read_nutrition(item)
+    if ingredient.nutrition:
+        for field, value in ingredient.nutrition.items():
+            setattr(ingredient, field, value)
+    return ingredient
+
+
+def update_nutrition(batch):
+    """Записывает пищевую ценность в ингредиенты, которые уже были в БД.
+
+    bulk_create с ignore_conflicts не обновляет существующие строки,
+    поэтому их id находятся по названию и единице измерения.
+    """
+    batch = [item for item in batch if item.nutrition is not None]
+    if not batch:
+        return 0
+    ids = {
+        (name, measurement_unit): pk
+        for pk, name, measurement_unit in Ingredient.objects.filter(
+            name__in={item.name for item in batch}
+        ).values_list('pk', 'name', 'measurement_unit')
+    }
+    for item in batch:
+        item.pk = ids[(item.name, item.measurement_unit)]
+    Ingredient.objects.bulk_update(batch, NUTRITION_FIELDS)
+    return len(batch)
+
+
+READERS = {
+    'json': read_json,
+    'csv': read_csv,
+}
 
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из JSON или CSV без дублей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--format', choices=READERS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
     def handle(self, *args, **options):
-        with open((DIR_PATH + FILE_PATH), encoding='utf-8') as f:
-            data = json.load(f)
-
-            for item in data:
-                Ingredient.objects.create(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit']
-                )
-            self.stdout.write(self.style.SUCCESS('Ингрeдиенты загружены!'))
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        dry_run = options['dry_run']
+
+        started = time.monotonic()
+        total = 0
+        updated = 0
+        before = Ingredient.objects.count()
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            ingredients = (
+                make_ingredient(item)
+                for item in READERS[file_format](file)
+            )
+            while True:
+                batch = list(islice(ingredients, batch_size))
+                if not batch:
+                    break
+                if not dry_run:
+                    Ingredient.objects.bulk_create(
+                        batch, ignore_conflicts=True)
+                    updated += update_nutrition(batch)
+                total += len(batch)
+            if updated:
+                # bulk-операции не вызывают сигналов, поэтому пищевая
+                # ценность рецептов пересчитывается здесь.
+                RecipeNutrition.objects.rebuild()
+        elapsed = time.monotonic() - started
+        created = 0
+        if not dry_run:
+            created = Ingredient.objects.count() - before
+            bump_version(
+                'ingredients', *(('recipes',) if updated else ()))
+
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингрeдиенты {"проверены" if dry_run else "загружены"}: '
+            f'{total} строк за {elapsed:.2f} с ({rate:.0f} строк/с), '
+            f'добавлено {created}, с пищевой ценностью {updated}.'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_version
+from recipes.models import RecipeNutrition
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает пищевую ценность и стоимость всех рецептов '
+            'по данным ингредиентов.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        RecipeNutrition.objects.rebuild()
+        bump_version('recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Пищевая ценность пересчитана: рецептов '
+            f'{RecipeNutrition.objects.count()} за '
+            f'{time.monotonic() - started:.2f} с.'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from recipes.models import Recipe, RecipeSearchToken
+from recipes.search import update_search_vectors, uses_search_vector
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает поисковый индекс рецептов: вектор tsvector на '
+            'PostgreSQL или обратный индекс слов на других БД.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Рецептов в одной транзакции.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if uses_search_vector(using):
+            update_search_vectors(using)
+            self.stdout.write(self.style.SUCCESS(
+                'Векторы поиска рецептов пересчитаны.'))
+            return
+        recipe_ids = list(
+            Recipe.objects.using(using).order_by('pk').values_list(
+                'pk', flat=True))
+        batch_size = options['batch_size']
+        tokens = RecipeSearchToken.objects.db_manager(using)
+        for start in range(0, len(recipe_ids), batch_size):
+            tokens.rebuild(recipe_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс пересчитан: рецептов {len(recipe_ids)}.'))
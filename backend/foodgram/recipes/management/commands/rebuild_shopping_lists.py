@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списки покупок пользователей по их корзинам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Пользователей в одной транзакции.')
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(ShoppingCart.objects.values_list('user_id', flat=True))
+            | set(ShoppingListItem.objects.values_list('user_id', flat=True))
+        )
+        batch_size = options['batch_size']
+        for start in range(0, len(user_ids), batch_size):
+            ShoppingListItem.objects.rebuild(
+                user_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны: пользователей {len(user_ids)}.'))
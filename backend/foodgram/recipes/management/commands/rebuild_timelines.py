@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Собирает ленты подписок пользователей заново.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Пользователей в одной транзакции.')
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(Follow.objects.values_list('user_id', flat=True))
+            | set(TimelineEntry.objects.values_list('user_id', flat=True))
+        )
+        batch_size = options['batch_size']
+        for start in range(0, len(user_ids), batch_size):
+            TimelineEntry.objects.rebuild(user_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок собраны: пользователей {len(user_ids)}.'))
@@ -1,7 +1,20 @@
+import logging
+import math
+from collections import defaultdict
+
+from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery, Sum
+from django.utils import timezone
+
+from users.models import CounterFieldsMixin, User
+
+from .images import generate_variants, image_storage
+from .nutrition import NUTRITION_FIELDS, compute_nutrition
+from .search import FIELD_WEIGHTS, tokenize
 
-from users.models import User
+logger = logging.getLogger(__name__)
 
 
 class Tag(models.Model):
@@ -39,17 +52,85 @@ class Ingredient(models.Model):
         "Ед. измерения",
         max_length=200
     )
+    calories = models.FloatField(
+        'Калорийность, ккал на 100 ед.',
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+    )
+    proteins = models.FloatField(
+        'Белки, г на 100 ед.',
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+    )
+    fats = models.FloatField(
+        'Жиры, г на 100 ед.',
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+    )
+    carbohydrates = models.FloatField(
+        'Углеводы, г на 100 ед.',
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+    )
+    price = models.FloatField(
+        'Цена за 100 ед.',
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+    )
 
     class Meta:
         ordering = ('name', )
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_unit')]
 
     def __str__(self):
         return f'{self.name} ({self.measurement_unit})'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для чтения рецептов без N+1."""
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe',
+                queryset=IngredientsAmount.objects.select_related(
+                    'ingredient')
+            )
+        )
+
+    def generate_image_variants(self):
+        """Создаёт копии изображений рецептов и запоминает их имена.
+
+        Возвращает число обработанных изображений. Отсутствующие
+        и повреждённые файлы пропускаются.
+        """
+        names = sorted(set(self.exclude(image='').exclude(
+            image=None).values_list('image', flat=True)))
+        processed = 0
+        for name in names:
+            try:
+                variant_files = generate_variants(name)
+            except OSError:
+                logger.warning('Не удалось создать копии %s', name,
+                               exc_info=True)
+                continue
+            self.filter(image=name).update(image_variant_files=variant_files)
+            processed += 1
+        return processed
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -69,10 +150,17 @@ class Recipe(models.Model):
     image = models.ImageField(
         "Пикча=)",
         upload_to='recipes/images/',
+        storage=image_storage,
         blank=True,
         null=True,
         default=None
     )
+    image_variant_files = models.JSONField(
+        'Готовые копии изображения',
+        default=list,
+        blank=True,
+        editable=False
+    )
     name = models.CharField(
         'Название рецепта',
         max_length=200
@@ -85,14 +173,41 @@ class Recipe(models.Model):
         default=1,
         validators=(MinValueValidator(1, 'Минимум 1 минута'),),
     )
+    servings = models.PositiveSmallIntegerField(
+        'Количество порций',
+        default=1,
+        validators=(MinValueValidator(1, 'Минимум 1 порция'),),
+    )
     pub_date = models.DateTimeField(
         'Дата публикации рецепта',
         auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'Кол-во добавлений в избранное',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count',)
 
     class Meta:
         ordering = ('-pub_date', )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_newest_idx'),
+            models.Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_popular_idx'),
+            models.Index(
+                fields=('cooking_time', '-pub_date', '-id'),
+                name='recipe_cooking_time_idx'),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_newest_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -131,6 +246,23 @@ class IngredientsAmount(models.Model):
                 f'{self.ingredient.measurement_unit}')
 
 
+class FollowQuerySet(models.QuerySet):
+    """Подписки с авторами и превью их рецептов."""
+
+    def with_recipes(self, limit=None):
+        recipes = Recipe.objects.all()
+        if limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:limit]
+            ))
+        return self.select_related('author').prefetch_related(
+            Prefetch('author__recipes', queryset=recipes,
+                     to_attr='recipes_preview')
+        )
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         User,
@@ -144,11 +276,16 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='Подписка на автора'
     )
+    # Не auto_now_add: миграции генерируются при развёртывании, и
+    # колонке в существующей таблице нужно значение по умолчанию.
     created = models.DateTimeField(
         'Дата и время подписки',
-        auto_now_add=True
+        default=timezone.now,
+        editable=False
     )
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         ordering = ('-created', )
         verbose_name = 'Подписка'
@@ -218,3 +355,373 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return '{} добавил в корзину {}'.format(self.user.username,
                                                 self.recipe.name)
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def rebuild(self, user_ids, ingredient_ids=None):
+        """Пересчитывает строки списка покупок по корзинам пользователей.
+
+        Затрагиваются только строки переданных пользователей и, если они
+        заданы, ингредиентов - остальной список не перечитывается.
+        Пользователи блокируются, чтобы параллельные изменения одной
+        корзины пересчитывались по очереди.
+        """
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        items = self.filter(user_id__in=user_ids)
+        amounts = IngredientsAmount.objects.filter(
+            recipe__shopping_cart__user__in=user_ids)
+        if ingredient_ids is not None:
+            items = items.filter(ingredient_id__in=ingredient_ids)
+            amounts = amounts.filter(ingredient_id__in=ingredient_ids)
+        with transaction.atomic(using=self.db):
+            list(User.objects.select_for_update().filter(
+                pk__in=user_ids).order_by('pk').values_list('pk'))
+            items.delete()
+            self.bulk_create(
+                ShoppingListItem(
+                    user_id=row['recipe__shopping_cart__user'],
+                    ingredient_id=row['ingredient'],
+                    amount=row['total'],
+                )
+                for row in amounts.values(
+                    'recipe__shopping_cart__user', 'ingredient'
+                ).annotate(total=Sum('amount')).order_by()
+            )
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('id', )
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item')]
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списка покупок'
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class RecipeSearchTokenQuerySet(models.QuerySet):
+
+    def rebuild(self, recipe_ids=None):
+        """Перестраивает обратный индекс рецептов.
+
+        ``recipe_ids`` - id или подзапрос рецептов; без него индекс
+        строится заново целиком.
+        """
+        recipes = Recipe.objects.order_by()
+        amounts = IngredientsAmount.objects.order_by()
+        postings = self.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+            amounts = amounts.filter(recipe_id__in=recipe_ids)
+            postings = postings.filter(recipe_id__in=recipe_ids)
+        ingredients = defaultdict(list)
+        for recipe_id, name in amounts.values_list(
+                'recipe_id', 'ingredient__name'):
+            ingredients[recipe_id].append(name)
+        tokens = []
+        for pk, name, text in recipes.values_list('pk', 'name', 'text'):
+            fields = {
+                'name': name,
+                'ingredients': ' '.join(ingredients[pk]),
+                'text': text,
+            }
+            weights = defaultdict(int)
+            for field, value in fields.items():
+                for token in set(tokenize(value)):
+                    weights[token] += FIELD_WEIGHTS[field]
+            tokens.extend(
+                RecipeSearchToken(token=token, recipe_id=pk, weight=weight)
+                for token, weight in weights.items()
+            )
+        with transaction.atomic(using=self.db):
+            postings.delete()
+            self.bulk_create(tokens, batch_size=1000)
+
+
+class RecipeSearchToken(models.Model):
+    """Слово рецепта в обратном индексе для БД без полнотекстового поиска."""
+
+    token = models.CharField('Слово', max_length=64)
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        verbose_name='Рецепт'
+    )
+    weight = models.PositiveSmallIntegerField('Вес')
+
+    objects = RecipeSearchTokenQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('token', 'recipe'),
+                name='unique_recipe_search_token')]
+        verbose_name = 'Слово поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
+
+    def __str__(self):
+        return f'{self.token}: {self.recipe_id}'
+
+
+def latest_recipes(recipes):
+    """Последние рецепты для ленты: ``(id, автор, дата публикации)``."""
+    return recipes.order_by('-pub_date', '-id').values_list(
+        'pk', 'author_id', 'pub_date')[:settings.FEED_TIMELINE_LENGTH]
+
+
+def fanout_recipes():
+    """Рецепты авторов, которые раскладываются по лентам при публикации."""
+    return Recipe.objects.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS)
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+
+    def add(self, recipes, user_ids):
+        """Добавляет рецепты ``(id, автор, дата)`` в ленты пользователей."""
+        user_ids = list(user_ids)
+        self.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id in user_ids
+                for recipe_id, author_id, pub_date in recipes
+            ),
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+        self.trim(user_ids)
+
+    def trim(self, user_ids):
+        """Оставляет в лентах по FEED_TIMELINE_LENGTH последних рецептов."""
+        length = settings.FEED_TIMELINE_LENGTH
+        overflown = self.filter(user_id__in=user_ids).order_by().values(
+            'user_id').annotate(total=Count('pk')).filter(
+            total__gt=length).values_list('user_id', flat=True)
+        for user_id in list(overflown):
+            stale = self.filter(user_id=user_id).values_list(
+                'pk', flat=True)[length:]
+            self.filter(pk__in=list(stale)).delete()
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту последние рецепты нового автора из подписок."""
+        self.add(
+            list(latest_recipes(fanout_recipes().filter(author_id=author_id))),
+            (user_id,))
+
+    def rebuild(self, user_ids):
+        """Собирает ленты пользователей заново по их подпискам."""
+        with transaction.atomic(using=self.db):
+            self.filter(user_id__in=user_ids).delete()
+            for user_id in user_ids:
+                self.add(
+                    list(latest_recipes(fanout_recipes().filter(
+                        author__following__user_id=user_id))),
+                    (user_id,))
+
+
+class TimelineEntry(models.Model):
+    """Рецепт автора в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-pub_date', '-recipe_id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry')]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_newest_idx'),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx'),
+        ]
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт по совместным добавлениям в избранное и корзину."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_for',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        ordering = ('recipe', '-score', 'similar_id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe')]
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+    def __str__(self):
+        return f'{self.recipe_id} ~ {self.similar_id}: {self.score:.3f}'
+
+
+class RecipeNutritionQuerySet(models.QuerySet):
+
+    def rebuild(self, recipe_ids=None):
+        """Пересчитывает пищевую ценность и стоимость рецептов.
+
+        ``recipe_ids`` - id или подзапрос рецептов; без него пересчитываются
+        все рецепты. Строки ингредиентов суммирует compute_nutrition.
+        """
+        amounts = IngredientsAmount.objects.order_by()
+        recipes = Recipe.objects.order_by()
+        ingredients = Ingredient.objects.order_by()
+        rollups = self.all()
+        if recipe_ids is not None:
+            amounts = amounts.filter(recipe_id__in=recipe_ids)
+            recipes = recipes.filter(pk__in=recipe_ids)
+            ingredients = ingredients.filter(
+                pk__in=amounts.values('ingredient_id'))
+            rollups = rollups.filter(recipe_id__in=recipe_ids)
+        recipe_ids, totals, complete = compute_nutrition(
+            amounts.values_list(
+                'recipe_id', 'ingredient_id', 'amount').iterator(),
+            ingredients.values_list('pk', *NUTRITION_FIELDS))
+        servings = dict(recipes.values_list('pk', 'servings'))
+        with transaction.atomic(using=self.db):
+            rollups.delete()
+            self.bulk_create(
+                (
+                    RecipeNutrition.from_totals(
+                        recipe_id, values, servings[recipe_id], is_complete)
+                    for recipe_id, values, is_complete in zip(
+                        recipe_ids.tolist(), totals.tolist(),
+                        complete.tolist())
+                    if recipe_id in servings
+                ),
+                batch_size=1000
+            )
+
+
+class RecipeNutrition(models.Model):
+    """Пищевая ценность и стоимость рецепта - суммы по ингредиентам.
+
+    Пересчитывается при изменении рецепта или ингредиента, значения на
+    порцию хранятся отдельно, чтобы по ним фильтровать и сортировать.
+    Поле пусто, если значение неизвестно ни для одного ингредиента.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='nutrition',
+        verbose_name='Рецепт'
+    )
+    calories = models.FloatField('Калорийность, ккал', null=True)
+    proteins = models.FloatField('Белки, г', null=True)
+    fats = models.FloatField('Жиры, г', null=True)
+    carbohydrates = models.FloatField('Углеводы, г', null=True)
+    price = models.FloatField('Стоимость', null=True)
+    calories_per_serving = models.FloatField(
+        'Калорийность порции, ккал', null=True)
+    price_per_serving = models.FloatField('Стоимость порции', null=True)
+    complete = models.BooleanField(
+        'Данные есть для всех ингредиентов', default=False)
+
+    objects = RecipeNutritionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=('calories_per_serving',),
+                name='nutrition_calories_idx'),
+            models.Index(
+                fields=('price_per_serving',),
+                name='nutrition_price_idx'),
+        ]
+        verbose_name = 'Пищевая ценность рецепта'
+        verbose_name_plural = 'Пищевая ценность рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.calories} ккал'
+
+    @classmethod
+    def from_totals(cls, recipe_id, values, servings, complete):
+        values = {
+            field: None if math.isnan(value) else value
+            for field, value in zip(NUTRITION_FIELDS, values)
+        }
+        return cls(
+            recipe_id=recipe_id,
+            complete=complete,
+            calories_per_serving=get_per_serving(
+                values['calories'], servings),
+            price_per_serving=get_per_serving(values['price'], servings),
+            **values,
+        )
+
+
+def get_per_serving(value, servings):
+    return None if value is None else round(value / servings, 2)
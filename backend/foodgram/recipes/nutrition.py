@@ -0,0 +1,50 @@
+from itertools import chain
+
+# Пищевая ценность и цена ингредиента указываются на NUTRITION_BASE
+# единиц измерения: на 100 г, 100 мл, 100 шт.
+NUTRITION_FIELDS = ('calories', 'proteins', 'fats', 'carbohydrates', 'price')
+NUTRITION_BASE = 100
+
+
+def compute_nutrition(amounts, ingredients):
+    """Суммы по рецептам одним векторным проходом по строкам ингредиентов.
+
+    ``amounts`` - строки (рецепт, ингредиент, количество), они читаются
+    сразу в массив numpy,
+    ``ingredients`` - строки (id, *NUTRITION_FIELDS), неизвестные значения
+    - None. Возвращает ``(recipe_ids, totals, complete)``: totals - матрица
+    рецепт x NUTRITION_FIELDS, NaN там, где значение неизвестно ни для
+    одного ингредиента рецепта; complete - известны ли все значения всех
+    ингредиентов.
+    """
+    # numpy нужен только пересчёту, модели импортируют модуль без него.
+    import numpy as np
+
+    amounts = np.fromiter(
+        chain.from_iterable(amounts), dtype=np.int64).reshape(-1, 3)
+    recipe_ids, recipes = np.unique(amounts[:, 0], return_inverse=True)
+    values = np.full((len(amounts), len(NUTRITION_FIELDS)), np.nan)
+    ingredients = list(ingredients)
+    if ingredients:
+        ingredient_ids = np.array([row[0] for row in ingredients])
+        order = np.argsort(ingredient_ids)
+        ingredient_ids = ingredient_ids[order]
+        table = np.array(
+            [row[1:] for row in ingredients], dtype=np.float64)[order]
+        positions = np.searchsorted(ingredient_ids, amounts[:, 1])
+        positions = np.minimum(positions, len(ingredient_ids) - 1)
+        found = ingredient_ids[positions] == amounts[:, 1]
+        values[found] = table[positions[found]]
+    values *= amounts[:, 2, None] / NUTRITION_BASE
+    known = ~np.isnan(values)
+    values[~known] = 0
+    totals = np.empty((len(recipe_ids), len(NUTRITION_FIELDS)))
+    for column in range(len(NUTRITION_FIELDS)):
+        totals[:, column] = np.bincount(
+            recipes, weights=values[:, column], minlength=len(recipe_ids))
+        counted = np.bincount(
+            recipes, weights=known[:, column], minlength=len(recipe_ids))
+        totals[counted == 0, column] = np.nan
+    unknown = np.bincount(
+        recipes, weights=~known.all(axis=1), minlength=len(recipe_ids))
+    return recipe_ids, np.round(totals, 2), unknown == 0
@@ -0,0 +1,141 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+
+TOKEN_RE = re.compile(r'\w+')
+TOKEN_MAX_LENGTH = 64
+# Вес слова в рецепте - сумма весов полей, в которых оно встречается.
+FIELD_WEIGHTS = {'name': 4, 'ingredients': 2, 'text': 1}
+
+SEARCH_VECTOR_SQL = (
+    'ALTER TABLE recipes_recipe '
+    'ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector '
+    'ON recipes_recipe USING gin (search_vector)',
+    # Название - вес A, ингредиенты - B, описание - C.
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector(
+        bigint, text, text
+    ) RETURNS tsvector LANGUAGE sql STABLE AS $$
+        SELECT setweight(to_tsvector(%(config)s, coalesce($2, '')), 'A')
+            || setweight(to_tsvector(%(config)s, coalesce((
+                SELECT string_agg(ingredient.name, ' ')
+                FROM recipes_ingredientsamount amount
+                JOIN recipes_ingredient ingredient
+                    ON ingredient.id = amount.ingredient_id
+                WHERE amount.recipe_id = $1
+            ), '')), 'B')
+            || setweight(to_tsvector(%(config)s, coalesce($3, '')), 'C')
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_row()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector := recipes_recipe_search_vector(
+            NEW.id, NEW.name, NEW.text);
+        RETURN NEW;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_amounts()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE recipes_recipe
+        SET search_vector = recipes_recipe_search_vector(id, name, text)
+        WHERE id IN (SELECT recipe_id FROM changed_rows);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_ingredients()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE recipes_recipe
+        SET search_vector = recipes_recipe_search_vector(id, name, text)
+        WHERE id IN (
+            SELECT amount.recipe_id
+            FROM recipes_ingredientsamount amount
+            WHERE amount.ingredient_id IN (SELECT id FROM changed_rows)
+        );
+        RETURN NULL;
+    END
+    $$
+    """,
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector ON recipes_recipe',
+    """
+    CREATE TRIGGER recipes_recipe_search_vector
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_row()
+    """,
+    'DROP TRIGGER IF EXISTS recipes_amount_search_vector_insert '
+    'ON recipes_ingredientsamount',
+    """
+    CREATE TRIGGER recipes_amount_search_vector_insert
+    AFTER INSERT ON recipes_ingredientsamount
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION recipes_recipe_search_vector_amounts()
+    """,
+    'DROP TRIGGER IF EXISTS recipes_amount_search_vector_delete '
+    'ON recipes_ingredientsamount',
+    """
+    CREATE TRIGGER recipes_amount_search_vector_delete
+    AFTER DELETE ON recipes_ingredientsamount
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION recipes_recipe_search_vector_amounts()
+    """,
+    'DROP TRIGGER IF EXISTS recipes_ingredient_search_vector '
+    'ON recipes_ingredient',
+    """
+    CREATE TRIGGER recipes_ingredient_search_vector
+    AFTER UPDATE ON recipes_ingredient
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION recipes_recipe_search_vector_ingredients()
+    """,
+)
+
+UPDATE_SEARCH_VECTORS_SQL = (
+    'UPDATE recipes_recipe '
+    'SET search_vector = recipes_recipe_search_vector(id, name, text)'
+)
+
+
+def tokenize(value):
+    """Слова текста в нижнем регистре, ё заменяется на е."""
+    return [
+        token[:TOKEN_MAX_LENGTH]
+        for token in TOKEN_RE.findall(value.lower().replace('ё', 'е'))
+        if len(token) > 1
+    ]
+
+
+def uses_search_vector(using):
+    return connections[using].vendor == 'postgresql'
+
+
+def create_search_vector(using, **kwargs):
+    """Колонка tsvector с GIN-индексом и триггерами, которые её обновляют.
+
+    Ингредиенты рецепта меняются отдельными запросами, поэтому вектор
+    пересчитывается триггерами на уровне оператора по таблице изменённых
+    строк, в том числе при bulk_create.
+    """
+    if not uses_search_vector(using):
+        return
+    params = {'config': settings.RECIPE_SEARCH_CONFIG}
+    with connections[using].cursor() as cursor:
+        for statement in SEARCH_VECTOR_SQL:
+            cursor.execute(statement, params if '%(' in statement else None)
+        cursor.execute(
+            UPDATE_SEARCH_VECTORS_SQL + ' WHERE search_vector IS NULL')
+
+
+def update_search_vectors(using):
+    with connections[using].cursor() as cursor:
+        cursor.execute(UPDATE_SEARCH_VECTORS_SQL)
@@ -0,0 +1,234 @@
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import User
+
+from .feed import fan_out_recipe
+from .images import get_variant_names
+from .models import (FavoriteRecipe, Follow, Ingredient, IngredientsAmount,
+                     Recipe, RecipeNutrition, RecipeSearchToken, ShoppingCart,
+                     ShoppingListItem, TimelineEntry)
+from .search import uses_search_vector
+from .tasks import run_in_background
+
+TRIGRAM_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+)
+
+
+def create_trigram_indexes(using, **kwargs):
+    """Создаёт GIN-индексы pg_trgm для поиска ингредиентов по подстроке."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for statement in TRIGRAM_INDEXES:
+            cursor.execute(statement)
+
+
+def merge_duplicate_ingredients(using, **kwargs):
+    """Сливает ингредиенты с одинаковыми названием и единицей измерения.
+
+    Миграции генерируются при развёртывании, поэтому дубликаты, мешающие
+    ограничению unique_ingredient_unit, убираются перед migrate. Схема
+    моделей в этот момент может быть новее базы, поэтому только SQL по
+    колонкам, которые есть с первой версии. Строки рецептов и списков
+    покупок переносятся на оставшийся ингредиент, совпавшие суммируются.
+    """
+    connection = connections[using]
+    ingredients = Ingredient._meta.db_table
+    tables = connection.introspection.table_names()
+    if ingredients not in tables:
+        return
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT duplicate.id, kept.id FROM {quote(ingredients)} '
+            f'duplicate JOIN (SELECT name, measurement_unit, MIN(id) AS id '
+            f'FROM {quote(ingredients)} GROUP BY name, measurement_unit '
+            f'HAVING COUNT(*) > 1) kept ON duplicate.name = kept.name '
+            f'AND duplicate.measurement_unit = kept.measurement_unit '
+            f'AND duplicate.id <> kept.id')
+        duplicates = cursor.fetchall()
+        for model, key in ((IngredientsAmount, 'recipe_id'),
+                           (ShoppingListItem, 'user_id')):
+            table = quote(model._meta.db_table)
+            if model._meta.db_table not in tables:
+                continue
+            for duplicate, kept in duplicates:
+                cursor.execute(
+                    f'UPDATE {table} SET amount = amount + ('
+                    f'SELECT other.amount FROM {table} other '
+                    f'WHERE other.ingredient_id = %s '
+                    f'AND other.{key} = {table}.{key}) '
+                    f'WHERE ingredient_id = %s AND {key} IN ('
+                    f'SELECT {key} FROM {table} WHERE ingredient_id = %s)',
+                    (duplicate, kept, duplicate))
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE ingredient_id = %s '
+                    f'AND {key} IN (SELECT {key} FROM {table} '
+                    f'WHERE ingredient_id = %s)', (duplicate, kept))
+                cursor.execute(
+                    f'UPDATE {table} SET ingredient_id = %s '
+                    f'WHERE ingredient_id = %s', (kept, duplicate))
+        for duplicate, _ in duplicates:
+            cursor.execute(
+                f'DELETE FROM {quote(ingredients)} WHERE id = %s',
+                (duplicate,))
+
+
+def change_counter(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+def favorite_created(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe.objects.filter(pk=instance.recipe_id),
+                       'favorites_count', 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+def favorite_deleted(instance, **kwargs):
+    change_counter(Recipe.objects.filter(pk=instance.recipe_id),
+                   'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(User.objects.filter(pk=instance.author_id),
+                   'recipes_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, **kwargs):
+    if created:
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    change_counter(User.objects.filter(pk=instance.author_id),
+                   'followers_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_variants(instance, **kwargs):
+    # Копии записываются в рецепт по имени изображения, новое имя
+    # (другое изображение) не совпадёт с записанными копиями.
+    if instance.image and not set(get_variant_names(
+            instance.image.name)) <= set(instance.image_variant_files):
+        recipes = Recipe.objects.filter(image=instance.image.name)
+        transaction.on_commit(
+            lambda: run_in_background(recipes.generate_image_variants))
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_fan_out(instance, created, **kwargs):
+    if created:
+        recipe_id = instance.pk
+        transaction.on_commit(
+            lambda: run_in_background(fan_out_recipe, recipe_id))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(instance, created, **kwargs):
+    if created:
+        TimelineEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(instance, **kwargs):
+    TimelineEntry.objects.filter(
+        user_id=instance.user_id, author_id=instance.author_id).delete()
+
+
+def get_recipe_ingredients(recipe_id):
+    return IngredientsAmount.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', flat=True)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_created(instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.rebuild(
+            (instance.user_id,), get_recipe_ingredients(instance.recipe_id))
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remember_cart_ingredients(instance, **kwargs):
+    # При каскадном удалении рецепта его ингредиенты могут быть удалены
+    # раньше строки корзины, поэтому запоминаем их заранее.
+    instance.shopping_list_ingredients = list(
+        get_recipe_ingredients(instance.recipe_id))
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_item_deleted(instance, **kwargs):
+    ShoppingListItem.objects.rebuild(
+        (instance.user_id,),
+        getattr(instance, 'shopping_list_ingredients', None))
+
+
+def index_recipes(recipe_ids, using):
+    transaction.on_commit(
+        lambda: RecipeSearchToken.objects.db_manager(using).rebuild(
+            recipe_ids),
+        using=using)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, using, **kwargs):
+    # На PostgreSQL вектор поиска обновляют триггеры. Индекс строится
+    # после коммита, когда ингредиенты рецепта уже сохранены.
+    if not uses_search_vector(using):
+        index_recipes((instance.pk,), using)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(instance, created, using, **kwargs):
+    if not created and not uses_search_vector(using):
+        index_recipes(
+            IngredientsAmount.objects.filter(
+                ingredient_id=instance.pk).values('recipe_id'),
+            using)
+
+
+def rebuild_ingredient_nutrition(ingredient_id):
+    RecipeNutrition.objects.rebuild(
+        IngredientsAmount.objects.filter(
+            ingredient_id=ingredient_id).values('recipe_id'))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_nutrition_changed(instance, using, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(
+        lambda: RecipeNutrition.objects.db_manager(using).rebuild(
+            (recipe_id,)),
+        using=using)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_nutrition_changed(instance, created, **kwargs):
+    # Ингредиент может входить в тысячи рецептов, поэтому пересчёт идёт
+    # в фоне.
+    if not created:
+        ingredient_id = instance.pk
+        transaction.on_commit(
+            lambda: run_in_background(
+                rebuild_ingredient_nutrition, ingredient_id))
@@ -0,0 +1,128 @@
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+
+from .models import FavoriteRecipe, Recipe, ShoppingCart, SimilarRecipe
+
+
+def load_interactions(queryset, chunk_size):
+    """Пары (пользователь, рецепт) массивом numpy.
+
+    Строки читаются курсором пачками по ``chunk_size`` и сразу
+    складываются в массив, объекты моделей не создаются.
+    """
+    rows = queryset.order_by().values_list(
+        'user_id', 'recipe_id').iterator(chunk_size=chunk_size)
+    return np.fromiter(
+        chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+
+
+def load_all_interactions(chunk_size):
+    """Избранное и корзины: оба действия считаются одним сигналом."""
+    return np.concatenate((
+        load_interactions(FavoriteRecipe.objects.all(), chunk_size),
+        load_interactions(ShoppingCart.objects.all(), chunk_size),
+    ))
+
+
+def build_similarity(interactions, top_k, min_support=1,
+                     max_user_items=None, block_pairs=1024 * 1024):
+    """Ближайшие соседи рецептов по косинусной мере.
+
+    Матрица пользователь x рецепт бинарная, сходство рецептов i и j -
+    ``c(i, j) / sqrt(n(i) * n(j))``, где c - число пользователей,
+    добавивших оба рецепта, n - число добавивших рецепт. Пары с
+    c < ``min_support`` отбрасываются. Рецепты обрабатываются блоками
+    примерно по ``block_pairs`` пар: для рецептов блока разворачиваются
+    все пары с рецептами тех же пользователей и агрегируются np.unique,
+    так что память ограничена размером блока, а не квадратом числа
+    рецептов. Пользователи, добавившие больше ``max_user_items``
+    рецептов, пропускаются: число пар растёт квадратично, а сигнала от
+    них мало.
+
+    Возвращает массивы ``(recipe_ids, similar_ids, scores)``, для каждого
+    рецепта - не больше ``top_k`` соседей по убыванию сходства.
+    """
+    empty = (np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0))
+    if not len(interactions) or top_k < 1:
+        return empty
+    recipe_ids, items = np.unique(interactions[:, 1], return_inverse=True)
+    _, users = np.unique(interactions[:, 0], return_inverse=True)
+    n_items = len(recipe_ids)
+    # Уникальные пары, упорядоченные по пользователю.
+    users, items = np.divmod(
+        np.unique(users.astype(np.int64) * n_items + items), n_items)
+    sizes = np.bincount(users)
+    if max_user_items is not None:
+        keep = sizes[users] <= max_user_items
+        users, items = users[keep], items[keep]
+        sizes = np.bincount(users, minlength=len(sizes))
+    if not len(items):
+        return empty
+    starts = np.cumsum(sizes) - sizes
+    popularity = np.bincount(items, minlength=n_items).astype(np.float64)
+    by_item = np.argsort(items, kind='stable')
+    item_starts = np.searchsorted(items[by_item], np.arange(n_items + 1))
+    # Границы блоков по накопленному числу пар.
+    pairs = np.cumsum(np.bincount(
+        items, weights=sizes[users], minlength=n_items))
+    bounds = np.unique(np.concatenate((
+        np.searchsorted(
+            pairs, np.arange(block_pairs, pairs[-1], block_pairs)),
+        (n_items,),
+    )))
+
+    sources, targets, scores = [], [], []
+    first = 0
+    for last in bounds.tolist():
+        last = max(last, first + 1)
+        rows = by_item[item_starts[first]:item_starts[last]]
+        first = last
+        lengths = sizes[users[rows]]
+        offsets = np.repeat(starts[users[rows]], lengths)
+        run_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        right = items[offsets + np.arange(len(offsets)) - run_starts]
+        left = np.repeat(items[rows], lengths)
+        keys, counts = np.unique(left * n_items + right, return_counts=True)
+        left, right = np.divmod(keys, n_items)
+        found = (left != right) & (counts >= min_support)
+        left, right = left[found], right[found]
+        similarity = counts[found] / np.sqrt(
+            popularity[left] * popularity[right])
+        order = np.lexsort((right, -similarity, left))
+        left = left[order]
+        rank = np.arange(len(left)) - np.searchsorted(left, left)
+        top = order[rank < top_k]
+        sources.append(recipe_ids[left[rank < top_k]])
+        targets.append(recipe_ids[right[top]])
+        scores.append(similarity[top])
+        if first >= n_items:
+            break
+    return (np.concatenate(sources), np.concatenate(targets),
+            np.concatenate(scores))
+
+
+def save_similarity(recipe_ids, similar_ids, scores, batch_size=5000):
+    """Заменяет таблицу похожих рецептов одной транзакцией.
+
+    Рецепты, удалённые во время расчёта, пропускаются.
+    """
+    with transaction.atomic():
+        existing = np.fromiter(
+            Recipe.objects.values_list('pk', flat=True), dtype=np.int64)
+        keep = (np.isin(recipe_ids, existing)
+                & np.isin(similar_ids, existing))
+        SimilarRecipe.objects.all().delete()
+        SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(
+                    recipe_id=recipe_id, similar_id=similar_id, score=score)
+                for recipe_id, similar_id, score in zip(
+                    recipe_ids[keep].tolist(),
+                    similar_ids[keep].tolist(),
+                    scores[keep].tolist())
+            ),
+            batch_size=batch_size
+        )
+        return int(keep.sum())
@@ -0,0 +1,41 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_TASK_WORKERS,
+            thread_name_prefix='foodgram-task'
+        )
+    return _executor
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась с ошибкой',
+                         func.__name__)
+    finally:
+        connection.close()
+
+
+def run_in_background(func, *args):
+    """Выполняет функцию в пуле потоков процесса.
+
+    При BACKGROUND_TASKS_EAGER задача выполняется сразу, это удобно
+    для management-команд и локальной отладки.
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        func(*args)
+        return
+    get_executor().submit(_run, func, *args)
@@ -0,0 +1,104 @@
+import tempfile
+from types import SimpleNamespace
+
+from django.contrib.admin import site
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from users.models import User
+
+from .admin import RecipeAdmin
+from .images import get_variant_name, get_variant_urls, image_storage
+from .models import (FavoriteRecipe, Follow, Ingredient, IngredientsAmount,
+                     Recipe, ShoppingCart, ShoppingListItem)
+
+
+class CounterFieldsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@test.ru', password='password')
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@test.ru', password='password')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание')
+
+    def test_full_save_keeps_concurrent_counter_updates(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        FavoriteRecipe.objects.create(user=self.reader, recipe=self.recipe)
+        Follow.objects.create(user=self.reader, author=self.author)
+        recipe.name = 'Новое название'
+        recipe.save()
+        author.first_name = 'Имя'
+        author.set_password('new-password')
+        author.save()
+
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(author.first_name, 'Имя')
+        self.assertTrue(author.check_password('new-password'))
+        self.assertEqual(author.recipes_count, 1)
+        self.assertEqual(author.followers_count, 1)
+
+
+class RecipeAdminShoppingListTest(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(
+            username='author', email='author@test.ru', password='password')
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@test.ru', password='password')
+        self.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание')
+        self.flour, self.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Сахар'))
+        IngredientsAmount.objects.create(
+            recipe=self.recipe, ingredient=self.flour, amount=100)
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipe)
+
+    def save_inline(self):
+        # Инлайн-формсет заменён функцией, меняющей ингредиенты так же,
+        # как его save().
+        IngredientsAmount.objects.filter(
+            recipe=self.recipe, ingredient=self.flour).update(amount=250)
+        IngredientsAmount.objects.create(
+            recipe=self.recipe, ingredient=self.sugar, amount=50)
+
+    def test_inline_ingredients_rebuild_shopping_list(self):
+        form = SimpleNamespace(instance=self.recipe, save_m2m=lambda: None)
+        formset = SimpleNamespace(save=self.save_inline)
+        RecipeAdmin(Recipe, site).save_related(None, form, [formset], True)
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user=self.reader).values_list('ingredient_id', 'amount')),
+            {self.flour.id: 250, self.sugar.id: 50})
+
+
+class VariantUrlsTest(TestCase):
+    def test_only_recorded_variants_have_urls(self):
+        name = 'recipes/images/abc.png'
+        thumbnail = get_variant_name(name, 'thumbnail')
+        stale = get_variant_name('recipes/images/old.png', 'webp')
+        urls = get_variant_urls(name, [thumbnail, stale])
+        self.assertTrue(urls['thumbnail'].endswith(thumbnail))
+        self.assertIsNone(urls['webp'])
+        self.assertIsNone(get_variant_urls('', [thumbnail]))
+
+
+class ContentAddressedStorageTest(TestCase):
+    def test_name_is_content_hash_for_any_upload(self):
+        with tempfile.TemporaryDirectory() as media_root, \
+                self.settings(MEDIA_ROOT=media_root):
+            first = image_storage.save(
+                'recipes/images/photo.JPG', ContentFile(b'first'))
+            second = image_storage.save(
+                'recipes/images/photo.JPG', ContentFile(b'second'))
+            again = image_storage.save(
+                'recipes/images/other.jpg', ContentFile(b'first'))
+            self.assertNotEqual(first, second)
+            self.assertEqual(first, again)
+            self.assertTrue(first.endswith('.jpg'))
+            with image_storage.open(second) as file:
+                self.assertEqual(file.read(), b'second')
@@ -5,7 +5,8 @@ from .models import User
 
 class UserAdmin(admin.ModelAdmin):
     list_display = (
-        'id', 'username', 'first_name', 'last_name', 'email'
+        'id', 'username', 'first_name', 'last_name', 'email',
+        'recipes_count', 'followers_count'
     )
     list_filter = ('first_name', 'email')
     empty_value_display = '-пусто-'
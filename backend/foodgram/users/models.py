@@ -2,7 +2,30 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """Денормализованные счётчики не перезаписываются полным сохранением.
+
+    Поля ``counter_fields`` меняются только F()-обновлениями из сигналов.
+    save() загруженной записи без update_fields записал бы прочитанное
+    в начале запроса значение поверх параллельных изменений, поэтому
+    такое сохранение обновляет все поля, кроме счётчиков.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     """ Mодель пользователя."""
 
     email = models.EmailField(
@@ -25,7 +48,18 @@ class User(AbstractUser):
         max_length=150,
         blank=False
     )
+    recipes_count = models.PositiveIntegerField(
+        'Кол-во рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Кол-во подписчиков',
+        default=0,
+        editable=False
+    )
 
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ('-pk',)